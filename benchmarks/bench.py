@@ -0,0 +1,238 @@
+"""Throughput and latency of the Lock and decorator hot paths
+
+Runs every scenario at low contention (each call uses its own key) and at
+high contention (all workers hammer the same key) and reports ops/sec
+together with p50 and p99 latency per call.
+
+    python benchmarks/bench.py                  # in-process MemoryBackend
+    python benchmarks/bench.py --redis-uri redis://localhost:6379/11 [--scripted]
+"""
+
+import argparse
+import asyncio
+import itertools
+import operator
+import threading
+import time
+
+from ddebounce import (
+    AsyncLock,
+    debounce,
+    Lock,
+    MemoryBackend,
+    RedisBackend,
+    skip_duplicates,
+)
+from ddebounce.aio import AsyncRedisBackend
+
+
+def percentile(latencies, fraction):
+    index = min(len(latencies) - 1, int(len(latencies) * fraction))
+    return latencies[index]
+
+
+def measure(operation, keys, workers):
+    latencies = []
+    mutex = threading.Lock()
+
+    def worker(keys):
+        timings = []
+        for key in keys:
+            start = time.perf_counter()
+            operation(key)
+            timings.append(time.perf_counter() - start)
+        with mutex:
+            latencies.extend(timings)
+
+    threads = [
+        threading.Thread(target=worker, args=(keys[index::workers],))
+        for index in range(workers)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return (
+        len(latencies) / elapsed,
+        percentile(latencies, 0.5),
+        percentile(latencies, 0.99),
+    )
+
+
+def measure_async(operation, keys, workers):
+    latencies = []
+
+    async def worker(keys):
+        for key in keys:
+            start = time.perf_counter()
+            await operation(key)
+            latencies.append(time.perf_counter() - start)
+
+    async def run():
+        await asyncio.gather(
+            *(worker(keys[index::workers]) for index in range(workers))
+        )
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return (
+        len(latencies) / elapsed,
+        percentile(latencies, 0.5),
+        percentile(latencies, 0.99),
+    )
+
+
+def acquire(client, ttl):
+    return Lock(client, ttl).acquire
+
+
+def release(client, ttl):
+    return Lock(client, ttl).release
+
+
+def lock_debounce(client, ttl, **options):
+    @Lock(client, ttl).debounce(key="{}".format, **options)
+    def spam(key):
+        pass
+
+    return spam
+
+
+def lock_debounce_with_repeat(client, ttl):
+    return lock_debounce(client, ttl, repeat=True)
+
+
+def lock_debounce_with_callback(client, ttl):
+    return lock_debounce(client, ttl, callback=lambda key: None)
+
+
+def api_skip_duplicates(client, ttl):
+    @skip_duplicates(client, key="{}".format, ttl=ttl)
+    def spam(key):
+        pass
+
+    return spam
+
+
+def api_debounce_with_instance_client(client, ttl):
+    class Spam:
+        def __init__(self, client):
+            self.client = client
+
+        @debounce(operator.attrgetter("client"), key="{}".format, ttl=ttl)
+        def spam(self, key):
+            pass
+
+    return Spam(client).spam
+
+
+def async_lock_acquire(client, ttl):
+    return AsyncLock(client, ttl).acquire
+
+
+def async_lock_debounce(client, ttl):
+    @AsyncLock(client, ttl).debounce(key="{}".format)
+    async def spam(key):
+        pass
+
+    return spam
+
+
+def api_debounce_coroutine(client, ttl):
+    @debounce(client, key="{}".format, ttl=ttl)
+    async def spam(key):
+        pass
+
+    return spam
+
+
+SCENARIOS = (
+    acquire,
+    release,
+    lock_debounce,
+    lock_debounce_with_repeat,
+    lock_debounce_with_callback,
+    api_skip_duplicates,
+    api_debounce_with_instance_client,
+)
+
+ASYNC_SCENARIOS = (async_lock_acquire, async_lock_debounce, api_debounce_coroutine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--redis-uri",
+        help="benchmark against Redis (lock:bench:* keys are deleted afterwards)",
+    )
+    parser.add_argument(
+        "--scripted", action="store_true", help="use Lua scripts against Redis"
+    )
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ttl", type=int, default=30)
+    options = parser.parse_args()
+
+    if options.redis_uri:
+        import redis
+        import redis.asyncio
+
+        client = redis.StrictRedis.from_url(options.redis_uri)
+        backend = RedisBackend(client, options.scripted)
+
+        def new_client():
+            return backend
+
+        def new_async_client():
+            # a fresh client per scenario, each one runs in its own event loop
+            async_client = redis.asyncio.StrictRedis.from_url(options.redis_uri)
+            return AsyncRedisBackend(async_client, options.scripted)
+
+        def cleanup():
+            keys = client.scan_iter(match="lock:bench:*", count=1000)
+            for batch in iter(lambda: list(itertools.islice(keys, 1000)), []):
+                client.delete(*batch)
+
+    else:
+        new_client = new_async_client = MemoryBackend
+
+        def cleanup():
+            pass
+
+    contention = {
+        "low": ["bench:{}".format(index) for index in range(options.calls)],
+        "high": ["bench:hot"] * options.calls,
+    }
+
+    print(
+        "{:<36} {:<5} {:>12} {:>10} {:>10}".format(
+            "scenario", "load", "ops/sec", "p50 (us)", "p99 (us)"
+        )
+    )
+    runs = [(scenario, new_client, measure) for scenario in SCENARIOS] + [
+        (scenario, new_async_client, measure_async) for scenario in ASYNC_SCENARIOS
+    ]
+
+    # keys left behind by an interrupted run would skew the first scenario
+    cleanup()
+    for scenario, client_factory, measure_scenario in runs:
+        for load, keys in contention.items():
+            operation = scenario(client_factory(), options.ttl)
+            ops, p50, p99 = measure_scenario(operation, keys, options.workers)
+            cleanup()
+            print(
+                "{:<36} {:<5} {:>12.0f} {:>10.1f} {:>10.1f}".format(
+                    scenario.__name__, load, ops, p50 * 1e6, p99 * 1e6
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,9 @@
-from .lock import Lock  # noqa: F401
-from .api import debounce, skip_duplicates  # noqa: F401
+from .backends import (  # noqa: F401
+    Backend,
+    MemoryBackend,
+    RedisBackend,
+    ShardedBackend,
+)
+from .lock import CircuitBreaker, Lock, SharedCallError, ShardedLock  # noqa: F401
+from .aio import AsyncLock  # noqa: F401
+from .api import debounce, debounce_batch, skip_duplicates, throttle  # noqa: F401
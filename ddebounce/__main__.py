@@ -0,0 +1,96 @@
+"""Inspect and clear lock keys
+
+Keys are looked up with SCAN and inspected in pipelined batches, never
+blocking Redis on KEYS, patterns match keys without their namespace.
+
+    python -m ddebounce list ['spam(*']          # keys, counts and ttls
+    python -m ddebounce count ['spam(*']
+    python -m ddebounce top [--limit 10]         # most contended keys
+    python -m ddebounce purge 'spam(*'           # delete stuck keys
+"""
+
+import argparse
+import heapq
+import itertools
+
+import redis
+import redis.cluster
+
+from .lock import Lock
+
+
+def batches(lock, pattern, size):
+    # hash-tagged keys open their tag right after the namespace
+    layout = "{}:{{{}" if lock.hash_tag else "{}:{}"
+    keys = lock.backend.scan(layout.format(lock.namespace, pattern), size)
+    return iter(lambda: list(itertools.islice(keys, size)), [])
+
+
+def statuses(lock, pattern, size):
+    for batch in batches(lock, pattern, size):
+        yield from zip(batch, lock.backend.status(batch))
+
+
+def show(value):
+    return "-" if value is None else value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ddebounce", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("--redis-uri", default="redis://localhost:6379/0")
+    parser.add_argument("--namespace", default="lock")
+    parser.add_argument(
+        "--cluster", action="store_true", help="connect to a Redis Cluster"
+    )
+    parser.add_argument(
+        "--hash-tag",
+        action="store_true",
+        help="keys are hash-tagged, the default with --cluster",
+    )
+    parser.add_argument(
+        "--batch", type=int, default=1000, help="keys per SCAN and pipeline"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list").add_argument("pattern", nargs="?", default="*")
+    commands.add_parser("count").add_argument("pattern", nargs="?", default="*")
+    top = commands.add_parser("top")
+    top.add_argument("pattern", nargs="?", default="*")
+    top.add_argument("--limit", type=int, default=10)
+    # no default, purging everything takes an explicit "*"
+    commands.add_parser("purge").add_argument("pattern")
+    options = parser.parse_args(argv)
+
+    if options.cluster:
+        client = redis.cluster.RedisCluster.from_url(options.redis_uri)
+    else:
+        client = redis.StrictRedis.from_url(options.redis_uri)
+    lock = Lock(client, namespace=options.namespace, hash_tag=options.hash_tag or None)
+
+    if options.command == "list":
+        for key, (count, ttl) in statuses(lock, options.pattern, options.batch):
+            print("{} {} {}".format(key, show(count), show(ttl)))
+    elif options.command == "count":
+        print(
+            sum(len(batch) for batch in batches(lock, options.pattern, options.batch))
+        )
+    elif options.command == "top":
+        counters = (
+            (count, key)
+            for key, (count, _) in statuses(lock, options.pattern, options.batch)
+            if count is not None
+        )
+        for count, key in heapq.nlargest(options.limit, counters):
+            print("{} {}".format(key, count))
+    else:
+        print(
+            sum(
+                lock.backend.purge(batch)
+                for batch in batches(lock, options.pattern, options.batch)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,528 @@
+import asyncio
+import contextlib
+import inspect
+import time
+import uuid
+
+from redis.asyncio.cluster import RedisCluster
+import wrapt
+
+from .backends import BATCH, counter, LATEST, MemoryBackend, RedisBackend, RESULT
+from .lock import (
+    Lock,
+    logger,
+    MEMO,
+    MIN_WAIT,
+    SharedCallError,
+    Status,
+    THROTTLE,
+    waiting,
+    WAKE,
+)
+
+
+class AsyncRedisBackend(RedisBackend):
+    async def acquire(self, key, ttl):
+        if self.scripted:
+            return await self.acquire_script(keys=[key], args=[ttl])
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        count, _ = await pipe.execute()
+        return count
+
+    async def release(self, key, ttl):
+        if self.scripted:
+            return await self.release_script(keys=[key], args=[ttl])
+        pipe = self.client.pipeline()
+        pipe.getset(key, 0)
+        pipe.expire(key, ttl)
+        count, _ = await pipe.execute()
+        return int(count) if count else 0
+
+    async def acquire_latest(self, key, ttl, payload):
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        pipe.set(key + LATEST, payload, ex=ttl)
+        count, _, _ = await pipe.execute()
+        return count
+
+    async def release_latest(self, key, ttl):
+        pipe = self.client.pipeline()
+        pipe.getset(key, 0)
+        pipe.expire(key, ttl)
+        pipe.get(key + LATEST)
+        pipe.delete(key + LATEST)
+        count, _, payload, _ = await pipe.execute()
+        return int(count) if count else 0, payload
+
+    async def handoff(self, key, ttl):
+        args = [ttl, int(not self.scripted)]
+        count, _ = await self.handoff_script(keys=[key], args=args)
+        return count
+
+    async def handoff_latest(self, key, ttl):
+        args = [ttl, int(not self.scripted)]
+        keys = [key, key + LATEST]
+        count, payload = await self.handoff_script(keys=keys, args=args)
+        return count, payload
+
+    async def acquire_shared(self, key, ttl, payload=None):
+        args = [ttl] if payload is None else [ttl, payload]
+        keys = [key, key + RESULT, key + LATEST]
+        return await self.shared_script(keys=keys, args=args)
+
+    async def acquire_batch(self, key, ttl, payload):
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        pipe.rpush(key + BATCH, payload)
+        pipe.expire(key + BATCH, ttl)
+        count, _, _, _ = await pipe.execute()
+        return count
+
+    async def drain(self, key, limit):
+        pipe = self.client.pipeline()
+        pipe.lrange(key + BATCH, 0, limit - 1)
+        pipe.ltrim(key + BATCH, limit, -1)
+        payloads, _ = await pipe.execute()
+        return payloads
+
+    async def extend(self, key, ttl):
+        return bool(await self.client.expire(key, ttl))
+
+    async def notify(self, key, ttl):
+        pipe = self.client.pipeline()
+        pipe.rpush(key, 1)
+        pipe.ltrim(key, 0, 0)
+        pipe.expire(key, ttl)
+        await pipe.execute()
+
+    async def wait(self, key, timeout):
+        return await self.client.blpop([key], timeout=timeout) is not None
+
+    async def take(self, key, ttl, shared=False):
+        keys = [key, key + RESULT] if shared else [key]
+        return bool(await self.take_script(keys=keys, args=[ttl]))
+
+    async def store(self, key, payload, ttl):
+        await self.client.set(key, payload, ex=ttl)
+
+    async def load(self, key):
+        return await self.client.get(key)
+
+    async def publish(self, key, payload, ttl):
+        if isinstance(self.client, RedisCluster):
+            await self.client.set(key, payload, ex=ttl)
+            await self.client.publish(key, payload)
+            return
+        pipe = self.client.pipeline()
+        pipe.set(key, payload, ex=ttl)
+        pipe.publish(key, payload)
+        await pipe.execute()
+
+    async def receive(self, key, timeout):
+        async with self.client.pubsub(ignore_subscribe_messages=True) as pubsub:
+
+            async def published():
+                message = None
+                while message is None:
+                    message = await pubsub.get_message(timeout=None)
+                return message["data"]
+
+            await pubsub.subscribe(key)
+            payload = await self.client.get(key)
+            if payload is None:
+                try:
+                    payload = await asyncio.wait_for(published(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return payload
+
+    async def status(self, keys):
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+            pipe.ttl(key)
+        replies = await pipe.execute(raise_on_error=False)
+        return [
+            (counter(count), ttl if ttl >= 0 else None)
+            for count, ttl in zip(replies[::2], replies[1::2])
+        ]
+
+    async def hit(self, key, now, limit, per):
+        member = "{}:{}".format(now, uuid.uuid4().hex)
+        return float(await self.hit_script(keys=[key], args=[now, per, limit, member]))
+
+
+class AsyncLock(Lock):
+    # same key layout and counting as `Lock`, awaiting a `redis.asyncio` client
+
+    backend_class = AsyncRedisBackend
+    time_windows = False
+    cluster_classes = (RedisCluster,)
+
+    async def acquire(self, key, wait=None, latest=None, shared=False):
+        key = self.format_key(key)
+        deadline = time.monotonic() + (wait or 0)
+        if await maybe_await(self.count(key, latest, shared)) <= 1:
+            return True
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            started = time.monotonic()
+            await maybe_await(self.backend.wait(key + WAKE, max(remaining, MIN_WAIT)))
+            waiting.set(waiting.get() + time.monotonic() - started)
+            self.waited.add(key)
+            if await maybe_await(self.backend.take(key, self.default_ttl, shared)):
+                return True
+
+    async def release(self, key, latest=False, handoff=False):
+        key = self.format_key(key)
+        payload = None
+        if latest:
+            release = (
+                self.backend.handoff_latest if handoff else self.backend.release_latest
+            )
+            count, payload = await maybe_await(release(key, self.default_ttl))
+        elif handoff:
+            count = await maybe_await(self.backend.handoff(key, self.default_ttl))
+        else:
+            count = await maybe_await(self.backend.release(key, self.default_ttl))
+        turns = count > 1
+        if not (turns and handoff) and (turns or key in self.waited):
+            self.waited.discard(key)
+            await maybe_await(self.backend.notify(key + WAKE, self.default_ttl))
+        if turns and payload is not None:
+            return self.serializer.loads(payload)
+        return turns
+
+    async def cached_acquire(self, key, wait=None, latest=None, shared=False):
+        if key in self.near_cache:
+            return False
+        acquired = await self.acquire(key, wait, latest, shared)
+        self.near_cache.add(key, self.default_ttl)
+        return acquired
+
+    async def acquire_batch(self, key, payload):
+        key = self.format_key(key)
+        count = self.backend.acquire_batch(key, self.default_ttl, payload)
+        return await maybe_await(count) <= 1
+
+    async def drain(self, key, limit):
+        payloads = self.backend.drain(self.format_key(key), limit)
+        return [
+            self.serializer.loads(payload) for payload in await maybe_await(payloads)
+        ]
+
+    async def coalesced_acquire(self, key, wait=None, latest=None, shared=False):
+        if not self.enter(key):
+            return False
+        try:
+            acquired = await self.acquire(key, wait, latest, shared)
+        except Exception:
+            self.leave(key)
+            raise
+        if not acquired:
+            self.leave(key)
+        return acquired
+
+    async def coalesced_release(self, key, latest=False, handoff=False):
+        try:
+            turns = await self.release(key, latest, handoff)
+        finally:
+            pending = self.leave(key)
+        return turns or pending
+
+    async def status(self, key):
+        return (await self.status_many([key]))[0]
+
+    async def status_many(self, keys):
+        keys = [self.format_key(key) for key in keys]
+        statuses = await maybe_await(self.backend.status(keys))
+        return [Status(*status) for status in statuses]
+
+    async def detached(self, func, *args):
+        try:
+            await func(*args)
+        except Exception:
+            logger.exception("Failed following up on debounced call")
+
+    @contextlib.asynccontextmanager
+    async def lease(self, key):
+        if not self.renew:
+            yield
+            return
+        key = self.format_key(key)
+        stop = asyncio.Event()
+
+        async def renew():
+            while True:
+                try:
+                    await asyncio.wait_for(stop.wait(), self.default_ttl / 3)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+                try:
+                    await maybe_await(self.backend.extend(key, self.default_ttl))
+                except Exception:
+                    logger.exception("Failed renewing %s", key)
+
+        watchdog = asyncio.ensure_future(renew())
+        try:
+            yield
+        finally:
+            stop.set()
+            await watchdog
+
+    async def publish(self, key, func, args, kwargs):
+        key = self.format_key(key) + RESULT
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as exc:
+            await self.share(key, {"error": [type(exc).__name__, str(exc)]})
+            raise
+        await self.share(key, {"result": result})
+        return result
+
+    async def share(self, key, outcome):
+        try:
+            payload = self.serializer.dumps(outcome)
+        except Exception:
+            logger.exception("Failed sharing outcome of %s", key)
+            return
+        await maybe_await(self.backend.publish(key, payload, self.default_ttl))
+
+    async def memoize(self, key, result, ttl):
+        key = self.format_key(key) + MEMO
+        try:
+            payload = self.serializer.dumps({"result": result})
+        except Exception:
+            logger.exception("Failed memoizing result of %s", key)
+            return
+        await maybe_await(self.backend.store(key, payload, ttl))
+
+    async def recall(self, key):
+        payload = await maybe_await(self.backend.load(self.format_key(key) + MEMO))
+        if payload is not None:
+            return self.serializer.loads(payload)
+
+    async def receive(self, key, timeout):
+        key = self.format_key(key) + RESULT
+        payload = await maybe_await(self.backend.receive(key, timeout))
+        if payload is None:
+            return
+        outcome = self.serializer.loads(payload)
+        if "error" in outcome:
+            raise SharedCallError(*outcome["error"])
+        return outcome["result"]
+
+    async def guarded(self, name, operation, func, key, *args):
+        if self.breaker.allow():
+            token = waiting.set(0.0)
+            start = time.monotonic()
+            try:
+                result = await func(key, *args)
+            except Exception:
+                logger.exception("Failed %s %s", operation, key)
+                self.breaker.failure()
+            else:
+                self.settle(time.monotonic() - start - waiting.get())
+                return True, result
+            finally:
+                waiting.reset(token)
+        self.fallbacks[operation] += 1
+        if self.hook is not None:
+            self.report("fallback", name)
+        return False, None
+
+    def local_lock(self):
+        return AsyncLock(MemoryBackend(), self.default_ttl)
+
+    def guarded_acquire(self, name, acquire):
+        async def guarded_acquire(key, *args):
+            ran, acquired = await self.guarded(name, "acquiring", acquire, key, *args)
+            if ran or self.fallback == "closed":
+                return acquired
+            self.degrade(key)
+            if self.fallback == "local":
+                return await self.local.acquire(key, *args)
+            return True
+
+        return guarded_acquire
+
+    def guarded_release(self, name, release):
+        async def guarded_release(key, *args):
+            if self.restore(key):
+                if self.fallback == "local":
+                    return await self.local.release(key, *args)
+                return False
+            _, turns = await self.guarded(name, "releasing", release, key, *args)
+            return turns or False
+
+        return guarded_release
+
+    def timed(self, event, name, func):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.report(event, name, time.perf_counter() - start)
+
+        return timed
+
+    def debounce_wrapper(
+        self,
+        operations,
+        repeat,
+        callback,
+        max_repeats,
+        share,
+        result_ttl,
+        block,
+        latest,
+    ):
+        format_key, acquire, release, call, emit = operations
+        shared = share is not None
+        handoff = (
+            repeat and block is None and not self.coalesce and self.executor is None
+        )
+
+        async def run(wrapped, key, args, kwargs, hold):
+            try:
+                async with self.lease(key):
+                    if share is None:
+                        result = await call(wrapped, *args, **kwargs)
+                    else:
+                        result = await call(self.publish, key, wrapped, args, kwargs)
+                    if result_ttl is not None:
+                        await self.memoize(key, result, result_ttl)
+            except BaseException:
+                await release(key, latest)
+                raise
+            return result, await release(key, latest, hold)
+
+        async def follow_up(wrapped, key, args, kwargs, result, turns):
+            repeats = 0
+            while True:
+                if isinstance(turns, list):
+                    args, kwargs = turns
+                if turns and callback:
+                    emit("callback")
+                    await maybe_await(callback(*args, **kwargs))
+                if not (turns and repeat):
+                    return result
+                if repeats == max_repeats:
+                    # pending turns are dropped, leaving the key released
+                    emit("exhausted")
+                    return result
+                if not handoff:
+                    payload = self.serializer.dumps([args, kwargs]) if latest else None
+                    if not await acquire(key, None, payload, shared):
+                        return
+                repeats += 1
+                emit("repeated")
+                hold = handoff and repeats != max_repeats
+                result, turns = await run(wrapped, key, args, kwargs, hold)
+
+        @wrapt.decorator
+        async def wrapper(wrapped, instance, args, kwargs):
+            key = format_key(*args, **kwargs)
+            if result_ttl is not None:
+                memoized = await self.recall(key)
+                if memoized is not None:
+                    emit("cached")
+                    return memoized["result"]
+            payload = self.serializer.dumps([args, kwargs]) if latest else None
+            if not await acquire(key, block, payload, shared):
+                emit("skipped")
+                if share is not None:
+                    return await self.receive(key, share)
+                return
+            emit("acquired")
+            hold = handoff and max_repeats != 0
+            result, turns = await run(wrapped, key, args, kwargs, hold)
+            if turns and (callback or repeat) and self.executor is not None:
+                self.executor(
+                    self.detached, follow_up, wrapped, key, args, kwargs, result, turns
+                )
+                return result
+            return await follow_up(wrapped, key, args, kwargs, result, turns)
+
+        return wrapper
+
+    def batch_wrapper(self, operations, max_batch):
+        format_key, acquire, release, call, emit = operations
+
+        @wrapt.decorator
+        async def wrapper(wrapped, instance, args, kwargs):
+            if len(args) != 1 or kwargs:
+                raise TypeError("Batched calls take a single argument")
+            key = format_key(*args)
+            if not await self.acquire_batch(key, self.serializer.dumps(args[0])):
+                emit("skipped")
+                return
+            emit("acquired")
+            while True:
+                try:
+                    async with self.lease(key):
+                        batch = await self.drain(key, max_batch)
+                        while batch:
+                            await call(wrapped, batch)
+                            batch = await self.drain(key, max_batch)
+                finally:
+                    turns = await release(key)
+                if not (turns and await acquire(key)):
+                    return
+                emit("repeated")
+
+        return wrapper
+
+    def throttle_wrapper(self, operations, limit, per, delay):
+        format_key, _, _, call, emit = operations
+
+        @wrapt.decorator
+        async def wrapper(wrapped, instance, args, kwargs):
+            key = self.format_key(format_key(*args, **kwargs)) + THROTTLE
+            retry = await maybe_await(self.backend.hit(key, time.time(), limit, per))
+            while retry and delay:
+                emit("delayed")
+                await asyncio.sleep(retry)
+                retry = await maybe_await(
+                    self.backend.hit(key, time.time(), limit, per)
+                )
+            if retry:
+                emit("throttled")
+                return
+            emit("acquired")
+            return await call(wrapped, *args, **kwargs)
+
+        return wrapper
+
+    def skip_duplicates_wrapper(self, operations, share):
+        format_key, acquire, _, call, emit = operations
+        shared = share is not None
+
+        @wrapt.decorator
+        async def wrapper(wrapped, instance, args, kwargs):
+            key = format_key(*args, **kwargs)
+            if await acquire(key, None, None, shared):
+                emit("acquired")
+                async with self.lease(key):
+                    if share is None:
+                        return await call(wrapped, *args, **kwargs)
+                    return await call(self.publish, key, wrapped, args, kwargs)
+            emit("skipped")
+            if share is not None:
+                return await self.receive(key, share)
+
+        return wrapper
+
+
+async def maybe_await(value):
+    if inspect.isawaitable(value):
+        value = await value
+    return value
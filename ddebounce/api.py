@@ -1,39 +1,128 @@
+import inspect
 import operator
+import weakref
 
 import wrapt
 
+from .aio import AsyncLock
 from .lock import Lock
 
 
-def debounce(client, wrapped=None, key=None, repeat=False, callback=None, ttl=None):
+def lock_class(func):
+    return AsyncLock if inspect.iscoroutinefunction(func) else Lock
+
+
+def per_client(client, func, decorate):
+    if not isinstance(client, operator.attrgetter):
+        return decorate(client, func)
+
+    # built once per resolved client and shared by every instance using it,
+    # cached Locks only weakly refer to their client so that caching never
+    # keeps clients alive
+    cache = weakref.WeakKeyDictionary()
+
     @wrapt.decorator
     def wrapper(wrapped, instance, args, kwargs):
-        if instance and isinstance(client, operator.attrgetter):
-            decorated = Lock(client(instance), ttl).debounce(
-                wrapped, key, repeat, callback
-            )
-        else:
-            decorated = Lock(client, ttl).debounce(wrapped, key, repeat, callback)
-        return decorated(*args, **kwargs)
+        resolved = client(instance)
+        try:
+            decorated = cache[resolved]
+        except KeyError:
+            decorated = cache[resolved] = decorate(weakref.proxy(resolved), func)
+        except TypeError:
+            # not hashable or not weak referenceable, built on each call
+            decorated = decorate(resolved, func)
+        return decorated.__get__(instance, type(instance))(*args, **kwargs)
+
+    return wrapper(func)
+
+
+def debounce(
+    client,
+    wrapped=None,
+    key=None,
+    repeat=False,
+    callback=None,
+    ttl=None,
+    max_repeats=None,
+    wait=None,
+    leading=False,
+    trailing=True,
+    share=None,
+    result_ttl=None,
+    block=None,
+    latest=False,
+    **options
+):
+    def decorate(client, func):
+        return lock_class(func)(client, ttl, **options).debounce(
+            func,
+            key,
+            repeat,
+            callback,
+            max_repeats,
+            wait,
+            leading,
+            trailing,
+            share,
+            result_ttl,
+            block,
+            latest,
+        )
 
     def logger(func):
-        func.debounce_applied = (key, repeat, callback, ttl)
-        return wrapper(func)
+        func.debounce_applied = (
+            key,
+            repeat,
+            callback,
+            ttl,
+            max_repeats,
+            wait,
+            leading,
+            trailing,
+            share,
+            result_ttl,
+            block,
+            latest,
+        )
+        return per_client(client, func, decorate)
 
     return logger
 
 
-def skip_duplicates(client, wrapped=None, key=None, ttl=None):
-    @wrapt.decorator
-    def wrapper(wrapped, instance, args, kwargs):
-        if instance and isinstance(client, operator.attrgetter):
-            decorated = Lock(client(instance), ttl).skip_duplicates(wrapped, key)
-        else:
-            decorated = Lock(client, ttl).skip_duplicates(wrapped, key)
-        return decorated(*args, **kwargs)
+def debounce_batch(client, wrapped=None, key=None, ttl=None, max_batch=100, **options):
+    def decorate(client, func):
+        return lock_class(func)(client, ttl, **options).debounce_batch(
+            func, key, max_batch
+        )
+
+    def logger(func):
+        func.debounce_batch_applied = (key, ttl, max_batch)
+        return per_client(client, func, decorate)
+
+    return logger
+
+
+def skip_duplicates(client, wrapped=None, key=None, ttl=None, share=None, **options):
+    def decorate(client, func):
+        return lock_class(func)(client, ttl, **options).skip_duplicates(
+            func, key, share
+        )
+
+    def logger(func):
+        func.skip_duplicates_applied = (key, ttl, share)
+        return per_client(client, func, decorate)
+
+    return logger
+
+
+def throttle(client, wrapped=None, key=None, limit=1, per=1, delay=False, **options):
+    def decorate(client, func):
+        return lock_class(func)(client, **options).throttle(
+            func, key, limit, per, delay
+        )
 
     def logger(func):
-        func.skip_duplicates_applied = (key, ttl)
-        return wrapper(func)
+        func.throttle_applied = (key, limit, per, delay)
+        return per_client(client, func, decorate)
 
     return logger
@@ -0,0 +1,932 @@
+import abc
+import bisect
+import collections
+import fnmatch
+import hashlib
+import itertools
+import threading
+import time
+import uuid
+
+from redis.cluster import RedisCluster
+
+ACQUIRE_SCRIPT = """
+local count = redis.call("INCR", KEYS[1])
+redis.call("EXPIRE", KEYS[1], ARGV[1])
+return count
+"""
+
+RELEASE_SCRIPT = """
+local count = tonumber(redis.call("GET", KEYS[1]) or 0)
+if count > 1 then
+    redis.call("SET", KEYS[1], 0, "EX", ARGV[1])
+else
+    redis.call("DEL", KEYS[1])
+end
+return count
+"""
+
+HANDOFF_SCRIPT = """
+local count = tonumber(redis.call("GET", KEYS[1]) or 0)
+if count > 1 then
+    redis.call("SET", KEYS[1], 1, "EX", ARGV[1])
+elseif ARGV[2] == "1" then
+    redis.call("SET", KEYS[1], 0, "EX", ARGV[1])
+else
+    redis.call("DEL", KEYS[1])
+end
+local payload = false
+if KEYS[2] then
+    payload = redis.call("GET", KEYS[2])
+    redis.call("DEL", KEYS[2])
+end
+return {count, payload}
+"""
+
+SHARED_SCRIPT = """
+local count = redis.call("INCR", KEYS[1])
+redis.call("EXPIRE", KEYS[1], ARGV[1])
+if count == 1 then
+    redis.call("DEL", KEYS[2])
+else
+    redis.call("EXPIRE", KEYS[2], ARGV[1])
+end
+if ARGV[2] then
+    redis.call("SET", KEYS[3], ARGV[2], "EX", ARGV[1])
+end
+return count
+"""
+
+TAKE_SCRIPT = """
+if tonumber(redis.call("GET", KEYS[1]) or 0) > 0 then
+    return 0
+end
+redis.call("SET", KEYS[1], 1, "EX", ARGV[1])
+if KEYS[2] then
+    redis.call("DEL", KEYS[2])
+end
+return 1
+"""
+
+SCHEDULE_SCRIPT = """
+local opened = redis.call("ZSCORE", KEYS[1], ARGV[1])
+redis.call("ZADD", KEYS[1], ARGV[2], ARGV[1])
+if ARGV[4] and (opened or ARGV[5] == "0") then
+    redis.call("SET", KEYS[2], ARGV[4], "EX", ARGV[3])
+end
+return opened and 1 or 0
+"""
+
+DUE_SCRIPT = """
+local due = {}
+local keys = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1], "LIMIT", 0, ARGV[2])
+for _, key in ipairs(keys) do
+    redis.call("ZREM", KEYS[1], key)
+    local payload = redis.call("GET", key .. ARGV[3])
+    if payload then
+        redis.call("DEL", key .. ARGV[3])
+        table.insert(due, key)
+        table.insert(due, payload)
+    end
+end
+return due
+"""
+
+HIT_SCRIPT = """
+local now, per, limit = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now - per)
+if redis.call("ZCARD", KEYS[1]) < limit then
+    redis.call("ZADD", KEYS[1], now, ARGV[4])
+    redis.call("PEXPIRE", KEYS[1], math.ceil(per * 1000))
+    return "0"
+end
+local oldest = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+return tostring(oldest[2] + per - now)
+"""
+
+# suffix of the key holding the pending call of a time window
+PAYLOAD = ":window"
+
+# suffix of the key holding the arguments of the latest call of a key
+LATEST = ":latest"
+
+# suffix of the list of payloads of batched calls of a key
+BATCH = ":batch"
+
+# suffix of the outcome of a call shared with the callers it skipped
+RESULT = ":result"
+
+# side keys a backend keeps on the node of the key they belong to
+SIDE_KEYS = (LATEST, BATCH, RESULT)
+
+# status of a missing key
+MISSING = (0, None)
+
+# positions on the ring of a ShardedBackend are 64 bits
+RING_SIZE = 2**64
+
+
+class Backend(abc.ABC):
+    """Counter store a `Lock` talks to
+
+    Both operations (re)set the key to expire after `ttl` seconds.
+    """
+
+    @abc.abstractmethod
+    def acquire(self, key, ttl):
+        """Increment the counter of `key` and return the new count"""
+
+    @abc.abstractmethod
+    def release(self, key, ttl):
+        """Reset the counter of `key` and return the count it had"""
+
+    def acquire_latest(self, key, ttl, payload):
+        """Like `acquire`, also keeping `payload` under `key` + `LATEST`
+
+        Optional, only debouncing with the latest arguments needs it,
+        along with `release_latest`.
+        """
+        raise NotImplementedError
+
+    def release_latest(self, key, ttl):
+        """Like `release`, also taking the payload kept by `acquire_latest`
+
+        Returns `(count, payload)`, `payload` being `None` if there is none.
+        """
+        raise NotImplementedError
+
+    def handoff(self, key, ttl):
+        """Like `release`, but keeps holding `key` if it had turns
+
+        Its count is then reset to 1 (and to expire after `ttl` seconds),
+        in a single round trip. Optional, only repeating debounced calls
+        needs it, along with `handoff_latest`.
+        """
+        raise NotImplementedError
+
+    def handoff_latest(self, key, ttl):
+        """Like `handoff`, also taking the payload kept by `acquire_latest`
+
+        Returns `(count, payload)` as `release_latest` does.
+        """
+        raise NotImplementedError
+
+    def acquire_shared(self, key, ttl, payload=None):
+        """Like `acquire`, also settling the outcome published under `key` + `RESULT`
+
+        The outcome is withdrawn when the key was free, the caller being the
+        one to publish the next, and reset to expire after `ttl` seconds
+        otherwise, outliving the key its skipped callers keep held. With a
+        `payload` it is kept as `acquire_latest` does. Optional, only sharing
+        outcomes with skipped callers needs it, along with `publish`.
+        """
+        raise NotImplementedError
+
+    def acquire_batch(self, key, ttl, payload):
+        """Like `acquire`, also appending `payload` to the list at `key` + `BATCH`
+
+        Optional, only batching calls needs it, along with `drain`.
+        """
+        raise NotImplementedError
+
+    def drain(self, key, limit):
+        """Take up to `limit` payloads appended by `acquire_batch`, oldest first"""
+        raise NotImplementedError
+
+    def extend(self, key, ttl):
+        """Reset `key` to expire after `ttl` seconds if it is still there
+
+        Returns whether it was. Optional, only lease renewal needs it.
+        """
+        raise NotImplementedError
+
+    def notify(self, key, ttl):
+        """Leave a token under `key` for `ttl` seconds, waking one waiter
+
+        At most one token is kept. Optional, only blocking acquires need
+        it, along with `wait`.
+        """
+        raise NotImplementedError
+
+    def wait(self, key, timeout):
+        """Take the token under `key`, waiting up to `timeout` seconds for one
+
+        Returns whether one was taken, waiters are woken in turn.
+        """
+        raise NotImplementedError
+
+    def take(self, key, ttl, shared=False):
+        """Acquire `key` if it is not held, without counting a turn if it is
+
+        Returns whether it was acquired, `shared` withdrawing the outcome
+        published under `key` + `RESULT` as `acquire_shared` does. Optional,
+        only the retries of blocking acquires need it.
+        """
+        raise NotImplementedError
+
+    def store(self, key, payload, ttl):
+        """Keep `payload` under `key` for `ttl` seconds
+
+        Optional, only memoizing results needs it, along with `load`.
+        """
+        raise NotImplementedError
+
+    def load(self, key):
+        """Return the payload stored under `key`, `None` if there is none"""
+        raise NotImplementedError
+
+    def publish(self, key, payload, ttl):
+        """Keep `payload` under `key` for `ttl` seconds and wake its receivers
+
+        Optional, only sharing results with skipped callers needs it.
+        """
+        raise NotImplementedError
+
+    def receive(self, key, timeout):
+        """Return the payload published under `key`
+
+        Waits up to `timeout` seconds for one to be published, returns
+        `None` if none was.
+        """
+        raise NotImplementedError
+
+    def schedule(self, index, key, deadline, ttl, payload=None, leading=False):
+        """Extend the time window of `key` in `index` up to `deadline`
+
+        Returns whether the window was already open. `payload` is kept
+        (for `ttl` seconds) as the call to make when the window closes,
+        unless `leading` is set and the window has just been opened.
+        Optional, only time window debouncing needs it.
+        """
+        raise NotImplementedError
+
+    def due(self, index, now, limit):
+        """Close up to `limit` windows of `index` ending by `now`
+
+        Returns `(key, payload)` pairs of the closed windows having a
+        pending call.
+        """
+        raise NotImplementedError
+
+    def hit(self, key, now, limit, per):
+        """Count a call at `now` against `limit` calls per `per` seconds
+
+        Calls are counted over a sliding window. Returns 0 if the call is
+        within the limit, or else the seconds until it would be (and does
+        not count it). Optional, only throttling needs it.
+        """
+        raise NotImplementedError
+
+    def status(self, keys):
+        """Return `(count, ttl)` of each of `keys`
+
+        `count` is 0 for missing keys and `None` for keys which are not
+        counters, `ttl` is the seconds left before the key expires, `None`
+        if it does not. Optional, only inspecting keys needs it, along with
+        `scan` and `purge`.
+        """
+        raise NotImplementedError
+
+    def scan(self, pattern, count):
+        """Iterate over keys matching the glob-style `pattern`
+
+        Keys are looked up about `count` at a time, without blocking the
+        store for long.
+        """
+        raise NotImplementedError
+
+    def purge(self, keys):
+        """Delete `keys` and return how many of them there were"""
+        raise NotImplementedError
+
+
+class RedisBackend(Backend):
+    def __init__(self, client, scripted=False):
+        self.client = client
+        self.scripted = scripted
+        if scripted:
+            # registered scripts are called by EVALSHA and loaded on NOSCRIPT
+            self.acquire_script = self.register(ACQUIRE_SCRIPT)
+            self.release_script = self.register(RELEASE_SCRIPT)
+        self.handoff_script = self.register(HANDOFF_SCRIPT)
+        self.shared_script = self.register(SHARED_SCRIPT)
+        self.take_script = self.register(TAKE_SCRIPT)
+        self.schedule_script = self.register(SCHEDULE_SCRIPT)
+        self.due_script = self.register(DUE_SCRIPT)
+        self.hit_script = self.register(HIT_SCRIPT)
+
+    def register(self, script):
+        registered = self.client.register_script(script)
+        # run through the client as given, which may be a weak proxy that
+        # the registering client method would otherwise strongly refer past
+        registered.registered_client = self.client
+        return registered
+
+    def acquire(self, key, ttl):
+        if self.scripted:
+            return self.acquire_script(keys=[key], args=[ttl])
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        count, _ = pipe.execute()
+        return count
+
+    def release(self, key, ttl):
+        if self.scripted:
+            return self.release_script(keys=[key], args=[ttl])
+        pipe = self.client.pipeline()
+        pipe.getset(key, 0)
+        pipe.expire(key, ttl)
+        count, _ = pipe.execute()
+        return int(count) if count else 0
+
+    def acquire_latest(self, key, ttl, payload):
+        # pipelined with or without scripts
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        pipe.set(key + LATEST, payload, ex=ttl)
+        count, _, _ = pipe.execute()
+        return count
+
+    def release_latest(self, key, ttl):
+        pipe = self.client.pipeline()
+        pipe.getset(key, 0)
+        pipe.expire(key, ttl)
+        pipe.get(key + LATEST)
+        pipe.delete(key + LATEST)
+        count, _, payload, _ = pipe.execute()
+        return int(count) if count else 0, payload
+
+    def handoff(self, key, ttl):
+        # scripted either way, a pipeline cannot keep the key held only if
+        # it had turns, released keys are left at 0 as release does unscripted
+        args = [ttl, int(not self.scripted)]
+        count, _ = self.handoff_script(keys=[key], args=args)
+        return count
+
+    def handoff_latest(self, key, ttl):
+        args = [ttl, int(not self.scripted)]
+        count, payload = self.handoff_script(keys=[key, key + LATEST], args=args)
+        return count, payload
+
+    def acquire_shared(self, key, ttl, payload=None):
+        args = [ttl] if payload is None else [ttl, payload]
+        return self.shared_script(keys=[key, key + RESULT, key + LATEST], args=args)
+
+    def acquire_batch(self, key, ttl, payload):
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        pipe.rpush(key + BATCH, payload)
+        pipe.expire(key + BATCH, ttl)
+        count, _, _, _ = pipe.execute()
+        return count
+
+    def drain(self, key, limit):
+        pipe = self.client.pipeline()
+        pipe.lrange(key + BATCH, 0, limit - 1)
+        pipe.ltrim(key + BATCH, limit, -1)
+        payloads, _ = pipe.execute()
+        return payloads
+
+    def extend(self, key, ttl):
+        return bool(self.client.expire(key, ttl))
+
+    def notify(self, key, ttl):
+        pipe = self.client.pipeline()
+        pipe.rpush(key, 1)
+        pipe.ltrim(key, 0, 0)
+        pipe.expire(key, ttl)
+        pipe.execute()
+
+    def wait(self, key, timeout):
+        return self.client.blpop([key], timeout=timeout) is not None
+
+    def take(self, key, ttl, shared=False):
+        keys = [key, key + RESULT] if shared else [key]
+        return bool(self.take_script(keys=keys, args=[ttl]))
+
+    def store(self, key, payload, ttl):
+        self.client.set(key, payload, ex=ttl)
+
+    def load(self, key):
+        return self.client.get(key)
+
+    def publish(self, key, payload, ttl):
+        if isinstance(self.client, RedisCluster):
+            # cluster pipelines refuse PUBLISH, set first all the same
+            self.client.set(key, payload, ex=ttl)
+            self.client.publish(key, payload)
+            return
+        pipe = self.client.pipeline()
+        pipe.set(key, payload, ex=ttl)
+        pipe.publish(key, payload)
+        pipe.execute()
+
+    def receive(self, key, timeout):
+        deadline = time.monotonic() + timeout
+        with self.client.pubsub(ignore_subscribe_messages=True) as pubsub:
+            # subscribed first so that nothing published after the get is missed
+            pubsub.subscribe(key)
+            payload = self.client.get(key)
+            while payload is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                message = pubsub.get_message(timeout=remaining)
+                if message:
+                    payload = message["data"]
+        return payload
+
+    def schedule(self, index, key, deadline, ttl, payload=None, leading=False):
+        args = [key, deadline, ttl]
+        if payload is not None:
+            args += [payload, int(leading)]
+        keys = [index, key + PAYLOAD]
+        return bool(self.schedule_script(keys=keys, args=args))
+
+    def due(self, index, now, limit):
+        due = self.due_script(keys=[index], args=[now, limit, PAYLOAD])
+        return [
+            (key.decode() if isinstance(key, bytes) else key, payload)
+            for key, payload in zip(due[::2], due[1::2])
+        ]
+
+    def hit(self, key, now, limit, per):
+        member = "{}:{}".format(now, uuid.uuid4().hex)
+        return float(self.hit_script(keys=[key], args=[now, per, limit, member]))
+
+    def status(self, keys):
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+            pipe.ttl(key)
+        # keys of other types fail the get without failing the others
+        replies = pipe.execute(raise_on_error=False)
+        return [
+            (counter(count), ttl if ttl >= 0 else None)
+            for count, ttl in zip(replies[::2], replies[1::2])
+        ]
+
+    def scan(self, pattern, count):
+        for key in self.client.scan_iter(match=pattern, count=count):
+            yield key.decode() if isinstance(key, bytes) else key
+
+    def purge(self, keys):
+        return self.client.delete(*keys) if keys else 0
+
+
+class MemoryBackend(Backend):
+    # in-process counters with the semantics of the scripted Redis backend
+
+    sweep_interval = 60
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.counters = {}
+        self.windows = {}
+        self.payloads = {}
+        self.hits = {}
+        self.latest = {}
+        self.batches = {}
+        self.tokens = {}
+        self.stored = {}
+        self.published = {}
+        self.mutex = threading.Lock()
+        self.condition = threading.Condition(self.mutex)
+        self.next_sweep = clock() + self.sweep_interval
+
+    def get(self, key):
+        count, expires = self.counters.get(key, (0, None))
+        if expires is not None and expires <= self.clock():
+            return 0
+        return count
+
+    def acquire(self, key, ttl):
+        with self.mutex:
+            self.sweep()
+            count = self.get(key) + 1
+            self.counters[key] = count, self.clock() + ttl
+            return count
+
+    def release(self, key, ttl):
+        with self.mutex:
+            count = self.get(key)
+            if count > 1:
+                self.counters[key] = 0, self.clock() + ttl
+            else:
+                self.counters.pop(key, None)
+            return count
+
+    def acquire_latest(self, key, ttl, payload):
+        with self.mutex:
+            self.sweep()
+            count = self.get(key) + 1
+            self.counters[key] = count, self.clock() + ttl
+            self.latest[key] = payload, self.clock() + ttl
+            return count
+
+    def release_latest(self, key, ttl):
+        with self.mutex:
+            count = self.get(key)
+            if count > 1:
+                self.counters[key] = 0, self.clock() + ttl
+            else:
+                self.counters.pop(key, None)
+            payload, expires = self.latest.pop(key, (None, None))
+            if expires is not None and expires <= self.clock():
+                payload = None
+            return count, payload
+
+    def handoff(self, key, ttl):
+        with self.mutex:
+            count = self.get(key)
+            if count > 1:
+                self.counters[key] = 1, self.clock() + ttl
+            else:
+                self.counters.pop(key, None)
+            return count
+
+    def handoff_latest(self, key, ttl):
+        count = self.handoff(key, ttl)
+        with self.mutex:
+            payload, expires = self.latest.pop(key, (None, None))
+            if expires is not None and expires <= self.clock():
+                payload = None
+            return count, payload
+
+    def acquire_shared(self, key, ttl, payload=None):
+        with self.mutex:
+            self.sweep()
+            count = self.get(key) + 1
+            now = self.clock()
+            self.counters[key] = count, now + ttl
+            outcome, expires = self.published.pop(key + RESULT, (None, None))
+            if count > 1 and expires is not None and expires > now:
+                self.published[key + RESULT] = outcome, now + ttl
+            if payload is not None:
+                self.latest[key] = payload, now + ttl
+            return count
+
+    def acquire_batch(self, key, ttl, payload):
+        with self.mutex:
+            self.sweep()
+            count = self.get(key) + 1
+            self.counters[key] = count, self.clock() + ttl
+            batch, expires = self.batches.get(key, ([], None))
+            if expires is not None and expires <= self.clock():
+                batch = []
+            batch.append(payload)
+            self.batches[key] = batch, self.clock() + ttl
+            return count
+
+    def drain(self, key, limit):
+        with self.mutex:
+            batch, expires = self.batches.get(key, ([], None))
+            if expires is None or expires <= self.clock():
+                return []
+            drained, batch[:limit] = batch[:limit], []
+            return drained
+
+    def extend(self, key, ttl):
+        with self.mutex:
+            count = self.get(key)
+            if not count:
+                return False
+            self.counters[key] = count, self.clock() + ttl
+            return True
+
+    def notify(self, key, ttl):
+        with self.condition:
+            self.tokens[key] = True, self.clock() + ttl
+            self.condition.notify_all()
+
+    def wait(self, key, timeout):
+        def token():
+            _, expires = self.tokens.get(key, (None, None))
+            return expires is not None and expires > self.clock()
+
+        with self.condition:
+            if not self.condition.wait_for(token, timeout):
+                return False
+            del self.tokens[key]
+            return True
+
+    def take(self, key, ttl, shared=False):
+        with self.mutex:
+            self.sweep()
+            if self.get(key) > 0:
+                return False
+            self.counters[key] = 1, self.clock() + ttl
+            if shared:
+                self.published.pop(key + RESULT, None)
+            return True
+
+    def store(self, key, payload, ttl):
+        with self.mutex:
+            self.stored[key] = payload, self.clock() + ttl
+
+    def load(self, key):
+        with self.mutex:
+            payload, expires = self.stored.get(key, (None, None))
+            if expires is not None and expires > self.clock():
+                return payload
+
+    def publish(self, key, payload, ttl):
+        with self.condition:
+            self.published[key] = payload, self.clock() + ttl
+            self.condition.notify_all()
+
+    def receive(self, key, timeout):
+        def payload():
+            payload, expires = self.published.get(key, (None, None))
+            if expires is not None and expires > self.clock():
+                return payload
+
+        with self.condition:
+            return self.condition.wait_for(payload, timeout)
+
+    def schedule(self, index, key, deadline, ttl, payload=None, leading=False):
+        with self.mutex:
+            windows = self.windows.setdefault(index, {})
+            opened = key in windows
+            windows[key] = deadline
+            if payload is not None and (opened or not leading):
+                self.payloads[key] = payload
+            return opened
+
+    def due(self, index, now, limit):
+        with self.mutex:
+            windows = self.windows.get(index, {})
+            keys = sorted(
+                (deadline, key) for key, deadline in windows.items() if deadline <= now
+            )
+            due = []
+            for _, key in keys[:limit]:
+                del windows[key]
+                if key in self.payloads:
+                    due.append((key, self.payloads.pop(key)))
+            return due
+
+    def hit(self, key, now, limit, per):
+        with self.mutex:
+            self.sweep()
+            hits, _ = self.hits.get(key, (collections.deque(), None))
+            while hits and hits[0] <= now - per:
+                hits.popleft()
+            if len(hits) < limit:
+                hits.append(now)
+                # forgotten once the latest call is out of the window
+                self.hits[key] = hits, self.clock() + per
+                return 0
+            return hits[0] + per - now
+
+    def status(self, keys):
+        with self.mutex:
+            now = self.clock()
+            statuses = []
+            for key in keys:
+                count, ttl = 0, None
+                # counters come first, any other store holds no counter
+                for store in self.stores:
+                    payload, expires = store.get(key, (None, now))
+                    if expires > now:
+                        count = payload if store is self.counters else None
+                        ttl = expires - now
+                        break
+                statuses.append((count, ttl))
+            return statuses
+
+    def scan(self, pattern, count):
+        with self.mutex:
+            now = self.clock()
+            keys = sorted(
+                {
+                    key
+                    for store in self.stores
+                    for key, (_, expires) in store.items()
+                    if expires > now and fnmatch.fnmatchcase(key, pattern)
+                }
+            )
+        return iter(keys)
+
+    def purge(self, keys):
+        with self.mutex:
+            now = self.clock()
+            purged = set()
+            for store in self.stores:
+                for key in keys:
+                    _, expires = store.pop(key, (None, None))
+                    if expires is not None and expires > now:
+                        purged.add(key)
+            return len(purged)
+
+    @property
+    def stores(self):
+        # payloads by key along with when they expire
+        return (
+            self.counters,
+            self.hits,
+            self.latest,
+            self.batches,
+            self.tokens,
+            self.stored,
+            self.published,
+        )
+
+    def sweep(self):
+        now = self.clock()
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + self.sweep_interval
+        for store in self.stores:
+            expired = [key for key, (_, expires) in store.items() if expires <= now]
+            for key in expired:
+                del store[key]
+
+
+# node of a ShardedBackend, with the share of keys routed to it and whether
+# it answered
+Shard = collections.namedtuple("Shard", "name share healthy")
+
+
+class ShardedBackend(Backend):
+    # keys routed across independent nodes by consistent hashing, each node
+    # placed on the ring at `replicas` points by its name, so that adding or
+    # removing one only moves the keys it takes or took over
+
+    def __init__(self, clients, scripted=False, replicas=100, names=None):
+        if not clients:
+            raise ValueError("at least one client is needed")
+        # nodes are named after their Redis connection by default, so that
+        # reordering clients moves no keys
+        self.names = list(names or map(node_name, clients, itertools.count()))
+        if len(set(self.names)) != len(clients):
+            raise ValueError("every client needs its own name")
+        self.backends = [
+            client if isinstance(client, Backend) else RedisBackend(client, scripted)
+            for client in clients
+        ]
+        self.ring = sorted(
+            (position("{}:{}".format(name, replica)), index)
+            for index, name in enumerate(self.names)
+            for replica in range(replicas)
+        )
+        self.positions = [point for point, _ in self.ring]
+
+    def node(self, key):
+        # keys sharing a hash tag share a node, as they would a cluster slot,
+        # untagged keys share the node of the key they are kept alongside
+        _, opened, rest = key.partition("{")
+        tag, closed, _ = rest.partition("}")
+        if opened and closed and tag:
+            key = tag
+        else:
+            while key.endswith(SIDE_KEYS):
+                key = key.rpartition(":")[0]
+        index = bisect.bisect(self.positions, position(key)) % len(self.ring)
+        return self.ring[index][1]
+
+    def backend(self, key):
+        return self.backends[self.node(key)]
+
+    def acquire(self, key, ttl):
+        return self.backend(key).acquire(key, ttl)
+
+    def release(self, key, ttl):
+        return self.backend(key).release(key, ttl)
+
+    def acquire_latest(self, key, ttl, payload):
+        return self.backend(key).acquire_latest(key, ttl, payload)
+
+    def release_latest(self, key, ttl):
+        return self.backend(key).release_latest(key, ttl)
+
+    def handoff(self, key, ttl):
+        return self.backend(key).handoff(key, ttl)
+
+    def handoff_latest(self, key, ttl):
+        return self.backend(key).handoff_latest(key, ttl)
+
+    def acquire_shared(self, key, ttl, payload=None):
+        return self.backend(key).acquire_shared(key, ttl, payload)
+
+    def acquire_batch(self, key, ttl, payload):
+        return self.backend(key).acquire_batch(key, ttl, payload)
+
+    def drain(self, key, limit):
+        return self.backend(key).drain(key, limit)
+
+    def extend(self, key, ttl):
+        return self.backend(key).extend(key, ttl)
+
+    def notify(self, key, ttl):
+        return self.backend(key).notify(key, ttl)
+
+    def wait(self, key, timeout):
+        return self.backend(key).wait(key, timeout)
+
+    def take(self, key, ttl, shared=False):
+        return self.backend(key).take(key, ttl, shared)
+
+    def store(self, key, payload, ttl):
+        return self.backend(key).store(key, payload, ttl)
+
+    def load(self, key):
+        return self.backend(key).load(key)
+
+    def publish(self, key, payload, ttl):
+        return self.backend(key).publish(key, payload, ttl)
+
+    def receive(self, key, timeout):
+        return self.backend(key).receive(key, timeout)
+
+    def schedule(self, index, key, deadline, ttl, payload=None, leading=False):
+        # the windows of an index all live on its node
+        return self.backend(index).schedule(index, key, deadline, ttl, payload, leading)
+
+    def due(self, index, now, limit):
+        return self.backend(index).due(index, now, limit)
+
+    def hit(self, key, now, limit, per):
+        return self.backend(key).hit(key, now, limit, per)
+
+    def status(self, keys):
+        # one pipeline per node, in the order of keys, keys missing from the
+        # node they route to are then looked up on the others, as payloads
+        # of time windows live on the node of their index
+        statuses = [MISSING] * len(keys)
+        homes = [self.node(key) for key in keys]
+        for at_home in (True, False):
+            for node, backend in enumerate(self.backends):
+                indexes = [
+                    index
+                    for index, home in enumerate(homes)
+                    if (home == node) == at_home and statuses[index] == MISSING
+                ]
+                if indexes:
+                    node_statuses = backend.status([keys[i] for i in indexes])
+                    for index, status in zip(indexes, node_statuses):
+                        statuses[index] = status
+        return statuses
+
+    def scan(self, pattern, count):
+        return itertools.chain.from_iterable(
+            backend.scan(pattern, count) for backend in self.backends
+        )
+
+    def purge(self, keys):
+        # deleted wherever they are, as status looks them up
+        return sum(backend.purge(keys) for backend in self.backends)
+
+    def shards(self):
+        # share of the ring each node takes, and whether it answers a ping
+        shares = collections.Counter()
+        previous = self.ring[-1][0] - RING_SIZE
+        for point, index in self.ring:
+            shares[index] += point - previous
+            previous = point
+        return [
+            Shard(name, shares[index] / RING_SIZE, healthy(backend))
+            for index, (name, backend) in enumerate(zip(self.names, self.backends))
+        ]
+
+
+def position(key):
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def node_name(client, index):
+    # host:port/db of a Redis client, the index of any other node
+    if isinstance(client, RedisBackend):
+        client = client.client
+    try:
+        kwargs = client.connection_pool.connection_kwargs
+    except AttributeError:
+        return str(index)
+    address = kwargs.get("path") or "{}:{}".format(
+        kwargs.get("host", "localhost"), kwargs.get("port", 6379)
+    )
+    return "{}/{}".format(address, kwargs.get("db", 0))
+
+
+def healthy(backend):
+    # backends other than Redis have nothing to ping
+    if not isinstance(backend, RedisBackend):
+        return True
+    try:
+        return bool(backend.client.ping())
+    except Exception:
+        return False
+
+
+def counter(value):
+    # count held by a counter key, None if the value is no counter
+    if value is None:
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
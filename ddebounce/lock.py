@@ -1,71 +1,910 @@
+import collections
+import contextlib
+import contextvars
 import functools
+import hashlib
+import importlib
+import json
+import logging
+import math
+import re
+import threading
+import time
 
+from redis.cluster import RedisCluster
 import wrapt
 
+from .backends import Backend, MemoryBackend, RedisBackend, RESULT, ShardedBackend
+
+logger = logging.getLogger(__name__)
+
+# functions debounced over a time window, by the name their calls are
+# stored under, so that workers only ever call functions meant to be called
+windowed = {}
+
+# modules (and the packages under them) workers may import to register the
+# functions of due calls, the top-level package of every function debounced
+# over a time window in this process is added
+windowed_modules = set()
+
+# seconds the acquire guarded in this context spent waiting for a release
+waiting = contextvars.ContextVar("waiting", default=0.0)
+
+# name of a function calls debounced over a time window are stored under
+WINDOWED_NAME = re.compile(r"^[A-Za-z_][\w.]*:[A-Za-z_][\w.<>]*$")
+
+# suffix of the sliding window of calls counted by a throttle
+THROTTLE = ":throttle"
+
+# suffix of the memoized result of a debounced call
+MEMO = ":memo"
+
+# suffix of the token a release leaves to wake a caller waiting for the key
+WAKE = ":wake"
+
+# longest blake2b digest of a hashed key, in bytes
+MAX_DIGEST_SIZE = 64
+
+# shortest wait on a wake token, shorter ones would block for good in Redis
+MIN_WAIT = 0.01
+
+
+class SharedCallError(Exception):
+    # raised to callers sharing the outcome of a call which failed, with the
+    # name of the exception it raised and its message
+    pass
+
+
+class NearCache:
+    # keys known to be held until they expire, beyond maxsize the least
+    # recently used are evicted, stats counts hits, misses and evictions
+
+    def __init__(self, maxsize, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.expiries = collections.OrderedDict()
+        self.stats = collections.Counter()
+        self.mutex = threading.Lock()
+
+    def __contains__(self, key):
+        with self.mutex:
+            expires = self.expiries.get(key)
+            if expires is None or expires <= self.clock():
+                self.expiries.pop(key, None)
+                self.stats["misses"] += 1
+                return False
+            self.expiries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True
+
+    def add(self, key, ttl):
+        with self.mutex:
+            self.expiries[key] = self.clock() + ttl
+            self.expiries.move_to_end(key)
+            while len(self.expiries) > self.maxsize:
+                self.expiries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+
+class CircuitBreaker:
+    # opened by `threshold` failures in a row, letting one trial call through
+    # every `reset_timeout` seconds until one succeeds, stats counts
+    # failures, rejected calls and times opened and closed
+
+    def __init__(self, threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened = None
+        self.stats = collections.Counter()
+        self.mutex = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return "closed"
+        if self.clock() - self.opened < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        with self.mutex:
+            if self.opened is None:
+                return True
+            now = self.clock()
+            if now - self.opened < self.reset_timeout:
+                self.stats["rejected"] += 1
+                return False
+            # the trial call, others are rejected for another reset_timeout
+            self.opened = now
+            return True
+
+    def success(self):
+        with self.mutex:
+            self.failures = 0
+            if self.opened is not None:
+                self.opened = None
+                self.stats["closed"] += 1
+
+    def failure(self):
+        with self.mutex:
+            self.failures += 1
+            self.stats["failures"] += 1
+            if self.failures >= self.threshold:
+                if self.opened is None:
+                    self.stats["opened"] += 1
+                self.opened = self.clock()
+
+
+Operations = collections.namedtuple(
+    "Operations", "format_key acquire release call emit"
+)
+
+# count of a key, 0 when not held and 1 when held without turns, and the
+# seconds left before it expires
+Status = collections.namedtuple("Status", "count ttl")
+
 
 class Lock:
-    def __init__(self, client, default_ttl=None):
+
+    backend_class = RedisBackend
+
+    def __init__(
+        self,
+        client,
+        default_ttl=None,
+        scripted=False,
+        hook=None,
+        serializer=json,
+        renew=False,
+        namespace="lock",
+        digest_size=None,
+        coalesce=False,
+        near_cache=None,
+        executor=None,
+        hash_tag=None,
+        fallback=None,
+        breaker=None,
+        slow_operation=None,
+    ):
+        # a ShardedLock, e.g. given to the decorators of the api, is taken
+        # for the nodes it routes keys across
+        if isinstance(client, ShardedLock):
+            client = client.backend
         self.client = client
         self.default_ttl = default_ttl or 30
+        # keys are renewed every third of default_ttl while their holder runs,
+        # so a short default_ttl only matters once the holder is gone
+        self.renew = renew
+        # keys are "<namespace>:<key>", or with a digest_size (in bytes, up
+        # to 64) "<namespace>:<key prefix>:<blake2b hex digest of the key>"
+        # keeping keys made of large arguments short
+        if digest_size is not None and not (0 < digest_size <= MAX_DIGEST_SIZE):
+            raise ValueError(
+                "digest_size must be from 1 to {} bytes".format(MAX_DIGEST_SIZE)
+            )
+        self.namespace = namespace
+        self.digest_size = digest_size
+        # with a hash_tag keys are "<namespace>:{<key>}", the keys kept along
+        # with a lock sharing its Redis Cluster slot so that they can be
+        # pipelined and scripted together, the default for cluster clients
+        # (which do not debounce over time windows, their index spanning slots)
+        if hash_tag is None:
+            hash_tag = isinstance(client, self.cluster_classes)
+        self.hash_tag = hash_tag
+        # debounced calls of a key already in flight in this process are
+        # counted as its turns without asking the backend
+        self.coalesce = coalesce
+        self.in_flight = {}
+        self.in_flight_mutex = threading.Lock()
+        # keys acquired after waiting, their release wakes the next waiter
+        self.waited = set()
+        # up to that many keys skip_duplicates saw held are skipped without
+        # asking the backend until they expire
+        self.near_cache = NearCache(near_cache) if near_cache else None
+        # called as executor(func, *args) to run callbacks and repeats of
+        # debounced calls off the caller, e.g. the submit of a bounded
+        # ThreadPoolExecutor or the spawn of an eventlet GreenPool, AsyncLock
+        # passes coroutine functions, e.g. to lambda f, *a: loop.create_task(f(*a))
+        self.executor = executor
+        # anything with `dumps` and `loads`, used for arguments kept in Redis
+        self.serializer = serializer
+        # called as hook(event, name, value=None) with the decorated function
+        # name, events are acquired, skipped, repeated, callback, exhausted
+        # (max_repeats reached with turns pending), throttled, delayed, cached
+        # (memoized result returned), fallback and acquire_time, release_time and
+        # call_time reporting seconds taken
+        self.hook = hook
+        # with a fallback, failing acquires and releases of decorated
+        # functions trip the breaker, and while it is open calls are run
+        # ("open"), skipped ("closed") or locked in-process ("local"),
+        # fallbacks counts them, acquires and releases taking longer than
+        # slow_operation seconds count as failures, not counting the time
+        # spent waiting for a release with block (they are only timed, not
+        # cut short, which is up to the socket_timeout of the client)
+        if fallback not in (None, "open", "closed", "local"):
+            raise ValueError('fallback must be "open", "closed" or "local"')
+        self.fallback = fallback
+        if fallback and breaker is None:
+            breaker = CircuitBreaker()
+        self.breaker = breaker
+        self.slow_operation = slow_operation
+        self.fallbacks = collections.Counter()
+        # keys acquired by a fallback, released by it too
+        self.degraded = collections.Counter()
+        self.degraded_mutex = threading.Lock()
+        if fallback == "local":
+            self.local = self.local_lock()
+        if isinstance(client, Backend):
+            if scripted:
+                raise ValueError("scripted applies to Redis clients, not backends")
+            self.backend = client
+        else:
+            self.backend = self.backend_class(client, scripted)
 
-    format_key = "lock:{}".format
+    # characters of a hashed key kept readable
+    digest_prefix = 32
 
-    def acquire(self, key):
+    cluster_classes = (RedisCluster,)
+
+    def format_key(self, key):
+        key = str(key)
+        if self.digest_size:
+            digest = hashlib.blake2b(key.encode(), digest_size=self.digest_size)
+            key = "{}:{}".format(key[: self.digest_prefix], digest.hexdigest())
+        if self.hash_tag:
+            key = "{{{}}}".format(key)
+        return "{}:{}".format(self.namespace, key)
+
+    window_index = "windows"
+
+    # whether calls can be debounced over time windows
+    time_windows = True
+
+    def acquire(self, key, wait=None, latest=None, shared=False):
+        # waits up to `wait` seconds for a release if the key is held,
+        # `latest` is kept as the serialized arguments of the latest call,
+        # `shared` settles the outcome shared with skipped callers
         key = self.format_key(key)
-        pipe = self.client.pipeline()
-        pipe.incr(key)
-        pipe.expire(key, self.default_ttl)
-        count, _ = pipe.execute()
-        return count <= 1
+        deadline = time.monotonic() + (wait or 0)
+        if self.count(key, latest, shared) <= 1:
+            return True
+        # counted as a turn once, retries only take the key once let go of
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            started = time.monotonic()
+            self.backend.wait(key + WAKE, max(remaining, MIN_WAIT))
+            waiting.set(waiting.get() + time.monotonic() - started)
+            self.waited.add(key)
+            if self.backend.take(key, self.default_ttl, shared):
+                return True
+
+    def count(self, key, latest, shared=False):
+        if shared:
+            return self.backend.acquire_shared(key, self.default_ttl, latest)
+        if latest is None:
+            return self.backend.acquire(key, self.default_ttl)
+        return self.backend.acquire_latest(key, self.default_ttl, latest)
+
+    def release(self, key, latest=False, handoff=False):
+        # with `latest`, turns are given as the latest [args, kwargs] if kept,
+        # with `handoff` the key is kept held for them
+        key = self.format_key(key)
+        payload = None
+        if latest:
+            release = (
+                self.backend.handoff_latest if handoff else self.backend.release_latest
+            )
+            count, payload = release(key, self.default_ttl)
+        elif handoff:
+            count = self.backend.handoff(key, self.default_ttl)
+        else:
+            count = self.backend.release(key, self.default_ttl)
+        turns = count > 1
+        # turns include callers that may be waiting, unless the key is kept
+        # held for them, and whoever waited may have been followed by others
+        # whose turns were reset by then
+        if not (turns and handoff) and (turns or key in self.waited):
+            self.waited.discard(key)
+            self.backend.notify(key + WAKE, self.default_ttl)
+        if turns and payload is not None:
+            return self.serializer.loads(payload)
+        return turns
+
+    def cached_acquire(self, key, wait=None, latest=None, shared=False):
+        if key in self.near_cache:
+            return False
+        acquired = self.acquire(key, wait, latest, shared)
+        # held, by this call or another one, at least until ttl from now
+        self.near_cache.add(key, self.default_ttl)
+        return acquired
+
+    def acquire_batch(self, key, payload):
+        key = self.format_key(key)
+        return self.backend.acquire_batch(key, self.default_ttl, payload) <= 1
+
+    def drain(self, key, limit):
+        payloads = self.backend.drain(self.format_key(key), limit)
+        return [self.serializer.loads(payload) for payload in payloads]
+
+    def coalesced_acquire(self, key, wait=None, latest=None, shared=False):
+        if not self.enter(key):
+            return False
+        try:
+            acquired = self.acquire(key, wait, latest, shared)
+        except Exception:
+            self.leave(key)
+            raise
+        if not acquired:
+            # turns counted meanwhile are left to whoever holds the key
+            self.leave(key)
+        return acquired
+
+    def coalesced_release(self, key, latest=False, handoff=False):
+        try:
+            turns = self.release(key, latest, handoff)
+        finally:
+            pending = self.leave(key)
+        return turns or pending
+
+    def enter(self, key):
+        with self.in_flight_mutex:
+            if key in self.in_flight:
+                self.in_flight[key] += 1
+                return False
+            self.in_flight[key] = 0
+            return True
 
-    def release(self, key):
+    def leave(self, key):
+        # whether calls were coalesced into the one leaving
+        with self.in_flight_mutex:
+            return self.in_flight.pop(key, 0) > 0
+
+    def status(self, key):
+        return self.status_many([key])[0]
+
+    def status_many(self, keys):
+        # pipelined by the backend
+        keys = [self.format_key(key) for key in keys]
+        return [Status(*status) for status in self.backend.status(keys)]
+
+    def detached(self, func, *args):
+        # nobody is left to raise to
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("Failed following up on debounced call")
+
+    @contextlib.contextmanager
+    def lease(self, key):
+        if not self.renew:
+            yield
+            return
         key = self.format_key(key)
-        pipe = self.client.pipeline()
-        pipe.getset(key, 0)
-        pipe.expire(key, self.default_ttl)
-        count, _ = pipe.execute()
-        count = int(count) if count else 0
-        return count > 1
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.default_ttl / 3):
+                try:
+                    self.backend.extend(key, self.default_ttl)
+                except Exception:
+                    logger.exception("Failed renewing %s", key)
+
+        watchdog = threading.Thread(target=renew, daemon=True)
+        watchdog.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            watchdog.join()
+
+    def publish(self, key, func, args, kwargs):
+        # call, sharing the outcome with the callers it skips
+        # the outcome of the previous call was withdrawn on acquiring
+        key = self.format_key(key) + RESULT
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            self.share(key, {"error": [type(exc).__name__, str(exc)]})
+            raise
+        self.share(key, {"result": result})
+        return result
+
+    def share(self, key, outcome):
+        try:
+            payload = self.serializer.dumps(outcome)
+        except Exception:
+            # skipped callers wait in vain rather than failing this one
+            logger.exception("Failed sharing outcome of %s", key)
+            return
+        self.backend.publish(key, payload, self.default_ttl)
+
+    def memoize(self, key, result, ttl):
+        key = self.format_key(key) + MEMO
+        try:
+            payload = self.serializer.dumps({"result": result})
+        except Exception:
+            logger.exception("Failed memoizing result of %s", key)
+            return
+        self.backend.store(key, payload, ttl)
+
+    def recall(self, key):
+        # memoized result as {"result": result}, None if there is none
+        payload = self.backend.load(self.format_key(key) + MEMO)
+        if payload is not None:
+            return self.serializer.loads(payload)
+
+    def receive(self, key, timeout):
+        # outcome of the call that skipped this one, None if not shared in time
+        payload = self.backend.receive(self.format_key(key) + RESULT, timeout)
+        if payload is None:
+            return
+        outcome = self.serializer.loads(payload)
+        if "error" in outcome:
+            raise SharedCallError(*outcome["error"])
+        return outcome["result"]
+
+    def report(self, event, name, value=None):
+        # hook failures are logged, they must never break the lock protocol
+        try:
+            self.hook(event, name, value)
+        except Exception:
+            logger.exception("Lock hook failed on %s for %s", event, name)
+
+    def timed(self, event, name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.report(event, name, time.perf_counter() - start)
+
+        return timed
 
-    def debounce(self, wrapped=None, key=None, repeat=False, callback=None):
+    def guarded(self, name, operation, func, key, *args):
+        # whether func ran, and what it returned
+        if self.breaker.allow():
+            token = waiting.set(0.0)
+            start = time.monotonic()
+            try:
+                result = func(key, *args)
+            except Exception:
+                logger.exception("Failed %s %s", operation, key)
+                self.breaker.failure()
+            else:
+                self.settle(time.monotonic() - start - waiting.get())
+                return True, result
+            finally:
+                waiting.reset(token)
+        self.fallbacks[operation] += 1
+        if self.hook is not None:
+            self.report("fallback", name)
+        return False, None
+
+    def settle(self, elapsed):
+        if self.slow_operation is not None and elapsed > self.slow_operation:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+
+    def degrade(self, key):
+        with self.degraded_mutex:
+            self.degraded[key] += 1
+
+    def restore(self, key):
+        # whether key was acquired by a fallback
+        with self.degraded_mutex:
+            if key not in self.degraded:
+                return False
+            self.degraded[key] -= 1
+            if not self.degraded[key]:
+                del self.degraded[key]
+            return True
+
+    def local_lock(self):
+        return Lock(MemoryBackend(), self.default_ttl)
+
+    def guarded_acquire(self, name, acquire):
+        def guarded_acquire(key, *args):
+            ran, acquired = self.guarded(name, "acquiring", acquire, key, *args)
+            if ran or self.fallback == "closed":
+                return acquired
+            self.degrade(key)
+            if self.fallback == "local":
+                return self.local.acquire(key, *args)
+            return True
+
+        return guarded_acquire
+
+    def guarded_release(self, name, release):
+        def guarded_release(key, *args):
+            if self.restore(key):
+                if self.fallback == "local":
+                    return self.local.release(key, *args)
+                return False
+            # keys left held expire after default_ttl
+            _, turns = self.guarded(name, "releasing", release, key, *args)
+            return turns or False
+
+        return guarded_release
+
+    def operations(self, wrapped, key, acquire=None, release=None):
+        # key formatter and the acquire, release, call and emit functions
+        # a decorated function uses, reporting to the hook if there is one
+        name = wrapped.__name__
+        format_key = key or "{0}({{0}})".format(name).format
+        acquire = acquire or self.acquire
+        release = release or self.release
+        if self.fallback is not None:
+            acquire = self.guarded_acquire(name, acquire)
+            release = self.guarded_release(name, release)
+        if self.hook is None:
+            return Operations(format_key, acquire, release, call, ignore)
+        return Operations(
+            format_key,
+            self.timed("acquire_time", name, acquire),
+            self.timed("release_time", name, release),
+            self.timed("call_time", name, call),
+            lambda event: self.report(event, name),
+        )
+
+    def debounce(
+        self,
+        wrapped=None,
+        key=None,
+        repeat=False,
+        callback=None,
+        max_repeats=None,
+        wait=None,
+        leading=False,
+        trailing=True,
+        share=None,
+        result_ttl=None,
+        block=None,
+        latest=False,
+    ):
 
         if wrapped is None:
             return functools.partial(
-                self.debounce, key=key, repeat=repeat, callback=callback
+                self.debounce,
+                key=key,
+                repeat=repeat,
+                callback=callback,
+                max_repeats=max_repeats,
+                wait=wait,
+                leading=leading,
+                trailing=trailing,
+                share=share,
+                result_ttl=result_ttl,
+                block=block,
+                latest=latest,
             )
 
-        vars(wrapped)["debounced"] = (key, repeat, callback)
+        vars(wrapped)["debounced"] = (key, repeat, callback, max_repeats)
+
+        if self.coalesce:
+            if latest:
+                raise ValueError("Arguments of coalesced calls are not kept")
+            operations = self.operations(
+                wrapped, key, self.coalesced_acquire, self.coalesced_release
+            )
+        else:
+            operations = self.operations(wrapped, key)
+        if wait is not None:
+            if not self.time_windows:
+                raise ValueError(
+                    "{} does not debounce over time windows".format(type(self).__name__)
+                )
+            if isinstance(self.client, self.cluster_classes):
+                # the index of time windows spans the slots of their keys
+                raise ValueError("Cluster clients do not debounce over time windows")
+            if (share, result_ttl, block) != (None, None, None):
+                raise ValueError(
+                    "Calls debounced over time windows are not shared, memoized "
+                    "or blocking"
+                )
+            name = "{}:{}".format(wrapped.__module__, wrapped.__qualname__)
+            windowed[name] = wrapped
+            windowed_modules.add(wrapped.__module__.partition(".")[0])
+            wrapper = self.window_wrapper(operations, name, wait, leading, trailing)
+            return wrapper(wrapped)
+
+        wrapper = self.debounce_wrapper(
+            operations,
+            repeat,
+            callback,
+            max_repeats,
+            share,
+            result_ttl,
+            block,
+            latest,
+        )
+        return wrapper(wrapped)
+
+    def debounce_wrapper(
+        self,
+        operations,
+        repeat,
+        callback,
+        max_repeats,
+        share,
+        result_ttl,
+        block,
+        latest,
+    ):
+        format_key, acquire, release, call, emit = operations
+        shared = share is not None
+        # a repeat is handed the key when released with turns, sparing a
+        # release and an acquire, unless waiters or calls coalesced in this
+        # process are to be let in between, or an executor runs the repeat
+        # once the key handed to it may have expired
+        handoff = (
+            repeat and block is None and not self.coalesce and self.executor is None
+        )
 
-        format_key = key or "{0}({{0}})".format(wrapped.__name__).format
+        def run(wrapped, key, args, kwargs, hold):
+            # one call, releasing the key after it (kept held with `hold`)
+            try:
+                with self.lease(key):
+                    if share is None:
+                        result = call(wrapped, *args, **kwargs)
+                    else:
+                        result = call(self.publish, key, wrapped, args, kwargs)
+                    if result_ttl is not None:
+                        self.memoize(key, result, result_ttl)
+            except BaseException:
+                release(key, latest)
+                raise
+            return result, release(key, latest, hold)
+
+        def follow_up(wrapped, key, args, kwargs, result, turns):
+            # callbacks and repeats for the turns taken during the last call
+            repeats = 0
+            while True:
+                if isinstance(turns, list):
+                    # repeat and callback use the latest arguments
+                    args, kwargs = turns
+                if turns and callback:
+                    emit("callback")
+                    callback(*args, **kwargs)
+                if not (turns and repeat):
+                    return result
+                if repeats == max_repeats:
+                    # pending turns are dropped, leaving the key released
+                    emit("exhausted")
+                    return result
+                if not handoff:
+                    payload = self.serializer.dumps([args, kwargs]) if latest else None
+                    if not acquire(key, None, payload, shared):
+                        return
+                repeats += 1
+                emit("repeated")
+                hold = handoff and repeats != max_repeats
+                result, turns = run(wrapped, key, args, kwargs, hold)
 
         @wrapt.decorator
         def wrapper(wrapped, instance, args, kwargs):
             key = format_key(*args, **kwargs)
-            if self.acquire(key):
+            if result_ttl is not None:
+                memoized = self.recall(key)
+                if memoized is not None:
+                    emit("cached")
+                    return memoized["result"]
+            payload = self.serializer.dumps([args, kwargs]) if latest else None
+            # only the first attempt waits for the key
+            if not acquire(key, block, payload, shared):
+                emit("skipped")
+                if share is not None:
+                    return self.receive(key, share)
+                return
+            emit("acquired")
+            hold = handoff and max_repeats != 0
+            result, turns = run(wrapped, key, args, kwargs, hold)
+            if turns and (callback or repeat) and self.executor is not None:
+                # the caller only waits for its own call
+                self.executor(
+                    self.detached, follow_up, wrapped, key, args, kwargs, result, turns
+                )
+                return result
+            return follow_up(wrapped, key, args, kwargs, result, turns)
+
+        return wrapper
+
+    def window_wrapper(self, operations, name, wait, leading, trailing):
+        format_key = operations.format_key
+        index = self.format_key(self.window_index)
+        ttl = math.ceil(wait) + self.default_ttl
+
+        @wrapt.decorator
+        def wrapper(wrapped, instance, args, kwargs):
+            if instance is not None:
+                raise TypeError("Time windows only debounce plain functions")
+            key = self.format_key(format_key(*args, **kwargs))
+            payload = None
+            if trailing:
+                payload = self.serializer.dumps([name, args, kwargs])
+            deadline = time.time() + wait
+            opened = self.backend.schedule(index, key, deadline, ttl, payload, leading)
+            if leading and not opened:
+                return wrapped(*args, **kwargs)
+
+        return wrapper
+
+    def run_due(self, limit=100, modules=()):
+        # make the trailing calls of the time windows which are over, the
+        # functions of modules not imported yet are only imported from
+        # `modules` or windowed_modules, each failing call is logged and the
+        # first failure raised once all are made
+        index = self.format_key(self.window_index)
+        due = self.backend.due(index, time.time(), limit)
+        errors = []
+        for key, payload in due:
+            try:
+                name, args, kwargs = self.serializer.loads(payload)
+                windowed_function(name, modules)(*args, **kwargs)
+            except Exception as exc:
+                logger.exception("Failed making debounced call of %s", key)
+                errors.append(exc)
+        if errors:
+            raise errors[0]
+        return len(due)
+
+    def run_worker(self, interval=0.1, limit=100, stop=None, modules=()):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                if self.run_due(limit, modules) == limit:
+                    continue
+            except Exception:
+                logger.exception("Failed making debounced calls")
+            stop.wait(interval)
+
+    def debounce_batch(self, wrapped=None, key=None, max_batch=100):
+        # calls pass a single argument and the function is called with lists
+        # of up to max_batch of them, those passed while it runs are kept in
+        # Redis for the caller holding the key to pass on
+
+        if wrapped is None:
+            return functools.partial(self.debounce_batch, key=key, max_batch=max_batch)
+
+        # calls share a single key by default
+        key = key or (lambda *args, **kwargs: wrapped.__name__)
+        operations = self.operations(wrapped, key)
+        return self.batch_wrapper(operations, max_batch)(wrapped)
+
+    def batch_wrapper(self, operations, max_batch):
+        format_key, acquire, release, call, emit = operations
+
+        @wrapt.decorator
+        def wrapper(wrapped, instance, args, kwargs):
+            if len(args) != 1 or kwargs:
+                raise TypeError("Batched calls take a single argument")
+            key = format_key(*args)
+            if not self.acquire_batch(key, self.serializer.dumps(args[0])):
+                emit("skipped")
+                return
+            emit("acquired")
+            while True:
                 try:
-                    result = wrapped(*args, **kwargs)
+                    with self.lease(key):
+                        batch = self.drain(key, max_batch)
+                        while batch:
+                            call(wrapped, batch)
+                            batch = self.drain(key, max_batch)
                 finally:
-                    turns = self.release(key)
-                if turns:
-                    if callback:
-                        callback(*args, **kwargs)
-                    if repeat:
-                        return wrapper(wrapped)(*args, **kwargs)
-                return result
+                    turns = release(key)
+                # calls made since the last drain are left to the next holder
+                if not (turns and acquire(key)):
+                    return
+                emit("repeated")
 
-        return wrapper(wrapped)
+        return wrapper
+
+    def throttle(self, wrapped=None, key=None, limit=1, per=1, delay=False):
+
+        if wrapped is None:
+            return functools.partial(
+                self.throttle, key=key, limit=limit, per=per, delay=delay
+            )
+
+        operations = self.operations(wrapped, key)
+        return self.throttle_wrapper(operations, limit, per, delay)(wrapped)
+
+    def throttle_wrapper(self, operations, limit, per, delay):
+        format_key, _, _, call, emit = operations
+
+        @wrapt.decorator
+        def wrapper(wrapped, instance, args, kwargs):
+            key = self.format_key(format_key(*args, **kwargs)) + THROTTLE
+            retry = self.backend.hit(key, time.time(), limit, per)
+            while retry and delay:
+                emit("delayed")
+                time.sleep(retry)
+                retry = self.backend.hit(key, time.time(), limit, per)
+            if retry:
+                emit("throttled")
+                return
+            emit("acquired")
+            return call(wrapped, *args, **kwargs)
+
+        return wrapper
 
-    def skip_duplicates(self, wrapped=None, key=None):
+    def skip_duplicates(self, wrapped=None, key=None, share=None):
 
         if wrapped is None:
-            return functools.partial(self.skip_duplicates, key=key)
+            return functools.partial(self.skip_duplicates, key=key, share=share)
 
-        format_key = key or "{0}({{0}})".format(wrapped.__name__).format
+        if self.near_cache is not None:
+            operations = self.operations(wrapped, key, self.cached_acquire)
+        else:
+            operations = self.operations(wrapped, key)
+        return self.skip_duplicates_wrapper(operations, share)(wrapped)
+
+    def skip_duplicates_wrapper(self, operations, share):
+        format_key, acquire, _, call, emit = operations
+        # acquiring withdraws the outcome of the previous call, duplicates
+        # keeping the key held keep the outcome of the last one too
+        shared = share is not None
 
         @wrapt.decorator
         def wrapper(wrapped, instance, args, kwargs):
             key = format_key(*args, **kwargs)
-            if self.acquire(key):
-                return wrapped(*args, **kwargs)
+            if acquire(key, None, None, shared):
+                emit("acquired")
+                with self.lease(key):
+                    if share is None:
+                        return call(wrapped, *args, **kwargs)
+                    return call(self.publish, key, wrapped, args, kwargs)
+            emit("skipped")
+            if share is not None:
+                return self.receive(key, share)
 
-        return wrapper(wrapped)
+        return wrapper
+
+
+class ShardedLock(Lock):
+    # a Lock routing keys across independent Redis nodes, see ShardedBackend,
+    # which decorators of the api take as their client
+
+    def __init__(
+        self,
+        clients,
+        default_ttl=None,
+        scripted=False,
+        replicas=100,
+        names=None,
+        **options
+    ):
+        backend = ShardedBackend(clients, scripted, replicas, names)
+        super().__init__(backend, default_ttl, **options)
+
+    def shards(self):
+        return self.backend.shards()
+
+
+def windowed_function(name, modules=()):
+    # importing the module of a function not decorated in this process yet
+    # registers it, anything not registered that way is never called, and
+    # only modules under windowed_modules or `modules` are ever imported
+    if name not in windowed and WINDOWED_NAME.match(name):
+        module = name.partition(":")[0]
+        allowed = windowed_modules.union(modules)
+        if any(
+            module == prefix or module.startswith(prefix + ".") for prefix in allowed
+        ):
+            importlib.import_module(module)
+    try:
+        return windowed[name]
+    except KeyError:
+        raise LookupError("{} is not debounced over a time window".format(name))
+
+
+def call(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def ignore(*args, **kwargs):
+    pass
@@ -1,23 +1,120 @@
+import collections
+import functools
+
 import pytest
 
+from .backends import Backend, MemoryBackend
+
+
+class LockClock:
+    # monotonic time of `lock_backend`, only moving when advanced
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def lock_clock():
+    return LockClock()
+
+
+@pytest.fixture
+def lock_backend(lock_clock):
+    # passed in place of a Redis client, keys expire as `lock_clock` advances
+    return MemoryBackend(clock=lock_clock)
+
+
+@pytest.fixture
+def lock_operations(lock_backend):
+    operations = collections.Counter()
+
+    def counted(name, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            operations[name] += 1
+            return method(*args, **kwargs)
+
+        return wrapper
+
+    for name in vars(Backend):
+        if not name.startswith("_"):
+            setattr(lock_backend, name, counted(name, getattr(lock_backend, name)))
+    return operations
+
 
 @pytest.fixture
 def debounce_applied():
-    def _debounce_applied(func, key=None, repeat=False, callback=None, ttl=None):
+    def _debounce_applied(
+        func,
+        key=None,
+        repeat=False,
+        callback=None,
+        ttl=None,
+        max_repeats=None,
+        wait=None,
+        leading=False,
+        trailing=True,
+        share=None,
+        result_ttl=None,
+        block=None,
+        latest=False,
+    ):
+        applied = (
+            key,
+            repeat,
+            callback,
+            ttl,
+            max_repeats,
+            wait,
+            leading,
+            trailing,
+            share,
+            result_ttl,
+            block,
+            latest,
+        )
         try:
-            return (key, repeat, callback, ttl) == getattr(func, "debounce_applied")
+            return applied == getattr(func, "debounce_applied")
         except AttributeError:
             return False
 
     return _debounce_applied
 
 
+@pytest.fixture
+def debounce_batch_applied():
+    def _debounce_batch_applied(func, key=None, ttl=None, max_batch=100):
+        try:
+            return (key, ttl, max_batch) == getattr(func, "debounce_batch_applied")
+        except AttributeError:
+            return False
+
+    return _debounce_batch_applied
+
+
 @pytest.fixture
 def skip_duplicates_applied():
-    def _skip_duplicates_applied(func, key=None, ttl=None):
+    def _skip_duplicates_applied(func, key=None, ttl=None, share=None):
         try:
-            return (key, ttl) == getattr(func, "skip_duplicates_applied")
+            return (key, ttl, share) == getattr(func, "skip_duplicates_applied")
         except AttributeError:
             return False
 
     return _skip_duplicates_applied
+
+
+@pytest.fixture
+def throttle_applied():
+    def _throttle_applied(func, key=None, limit=1, per=1, delay=False):
+        try:
+            return (key, limit, per, delay) == getattr(func, "throttle_applied")
+        except AttributeError:
+            return False
+
+    return _throttle_applied
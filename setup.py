@@ -7,8 +7,9 @@ setup(
     author='Student.com',
     url='http://github.com/iky/ddebounce',
     packages=['ddebounce'],
+    python_requires='>=3.7',
     install_requires=[
-        "redis>=2.10.5",
+        "redis>=4.3",
         'wrapt>=1.10.8',
     ],
     extras_require={
@@ -30,11 +31,11 @@ setup(
         "Operating System :: MacOS :: MacOS X",
         "Operating System :: POSIX",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.3",
-        "Programming Language :: Python :: 3.4",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
         "Topic :: Internet",
         "Topic :: Software Development :: Libraries :: Python Modules",
         "Intended Audience :: Developers",
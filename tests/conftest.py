@@ -1,5 +1,8 @@
 import pytest
 import redis
+import redis.asyncio
+import redis.asyncio.cluster
+import redis.cluster
 
 
 def pytest_addoption(parser):
@@ -10,6 +13,14 @@ def pytest_addoption(parser):
         default="redis://localhost:6379/11",
         help='Redis uri for testing (e.g. "redis://localhost:6379/11")',
     )
+    parser.addoption(
+        "--test-redis-cluster-uri",
+        action="store",
+        dest="TEST_REDIS_CLUSTER_URI",
+        default=None,
+        help="Redis Cluster uri, tests needing one are skipped without it (e.g. "
+        '"redis://localhost:7000/0")',
+    )
 
 
 @pytest.fixture
@@ -17,3 +28,31 @@ def redis_(request):
     client = redis.StrictRedis.from_url(request.config.getoption("TEST_REDIS_URI"))
     yield client
     client.flushdb()
+
+
+@pytest.fixture
+def async_redis(request, redis_):
+    return redis.asyncio.StrictRedis.from_url(
+        request.config.getoption("TEST_REDIS_URI")
+    )
+
+
+@pytest.fixture
+def redis_cluster_uri(request):
+    uri = request.config.getoption("TEST_REDIS_CLUSTER_URI")
+    if uri is None:
+        pytest.skip("no --test-redis-cluster-uri given")
+    return uri
+
+
+@pytest.fixture
+def redis_cluster(redis_cluster_uri):
+    client = redis.cluster.RedisCluster.from_url(redis_cluster_uri)
+    yield client
+    client.flushall()
+    client.close()
+
+
+@pytest.fixture
+def async_redis_cluster(redis_cluster, redis_cluster_uri):
+    return redis.asyncio.cluster.RedisCluster.from_url(redis_cluster_uri)
@@ -0,0 +1,708 @@
+import asyncio
+import operator
+
+from mock import ANY, call, Mock
+import pytest
+from redis.asyncio.cluster import RedisCluster
+
+from ddebounce import (
+    AsyncLock,
+    debounce,
+    debounce_batch,
+    SharedCallError,
+    skip_duplicates,
+    throttle,
+)
+
+
+@pytest.fixture
+def tracker():
+    return Mock()
+
+
+@pytest.fixture(params=(False, True), ids=("pipelined", "scripted"))
+def scripted(request):
+    return request.param
+
+
+def test_simple_acquire_and_release(async_redis, scripted):
+
+    lock = AsyncLock(async_redis, scripted=scripted)
+
+    async def scenario():
+        assert await lock.acquire("101") is True
+        assert await lock.acquire("101") is False
+        assert await lock.acquire("102") is True
+
+        assert await lock.release("101") is True
+        assert await lock.release("102") is False
+
+        assert await lock.release("wat") is False  # never acquired
+
+    asyncio.run(scenario())
+
+
+def test_debounce_with_repeat_and_callback(async_redis, redis_, tracker):
+
+    lock = AsyncLock(async_redis)
+
+    callback_tracker = Mock()
+    release = asyncio.Event()
+
+    async def callback(*args, **kwargs):
+        callback_tracker(*args, **kwargs)
+
+    @lock.debounce(repeat=True, callback=callback)
+    async def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        await release.wait()
+        return tracker
+
+    async def scenario():
+        task = asyncio.ensure_future(func("egg", spam="ham"))
+        await asyncio.sleep(0.1)
+
+        assert b"1" == redis_.get("lock:func(egg)")
+
+        # another caller is skipped without running the function
+        assert await func("egg", spam="ham") is None
+        assert 1 == tracker.call_count
+
+        release.set()
+
+        assert tracker == await task
+
+    asyncio.run(scenario())
+
+    assert b"0" == redis_.get("lock:func(egg)")
+
+    # repeated once for the skipped caller
+    assert [call("egg", spam="ham"), call("egg", spam="ham")] == tracker.call_args_list
+    assert [call("egg", spam="ham")] == callback_tracker.call_args_list
+
+
+def test_skip_duplicates(async_redis, redis_, tracker):
+
+    lock = AsyncLock(async_redis)
+
+    @lock.skip_duplicates
+    async def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        return tracker
+
+    async def scenario():
+        assert tracker == await func("egg", spam="ham")
+        assert await func("egg", spam="ham") is None
+
+    asyncio.run(scenario())
+
+    assert b"2" == redis_.get("lock:func(egg)")
+
+    assert 1 == tracker.call_count
+    assert call("egg", spam="ham") == tracker.call_args
+
+
+def test_debounce_with_max_repeats(async_redis, redis_, tracker):
+
+    lock = AsyncLock(async_redis)
+
+    callback_tracker = Mock()
+
+    @lock.debounce(repeat=True, callback=callback_tracker, max_repeats=2)
+    async def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        # simulate locking attempt on every execution
+        await async_redis.incr("lock:func(egg)")
+        return tracker
+
+    assert tracker == asyncio.run(func("egg", spam="ham"))
+
+    # executed once plus two repeats
+    assert 3 == tracker.call_count
+    assert 3 == callback_tracker.call_count
+
+    assert b"0" == redis_.get("lock:func(egg)")
+
+
+def test_debounce_with_repeat_failing_to_acquire(async_redis, redis_, tracker):
+
+    lock = AsyncLock(async_redis)
+
+    async def callback(*args, **kwargs):
+        # another process acquires before the repeat does
+        await lock.acquire("func(egg)")
+
+    # blocking callers are let in between repeats, which re-acquire the key
+    @lock.debounce(repeat=True, callback=callback, block=1)
+    async def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        if tracker.call_count == 1:
+            # simulate locking attempt
+            await async_redis.incr("lock:func(egg)")
+        return tracker
+
+    assert asyncio.run(func("egg", spam="ham")) is None
+
+    assert 1 == tracker.call_count
+    # held by the other process, counting the failed repeat attempt
+    assert b"2" == redis_.get("lock:func(egg)")
+
+
+@pytest.mark.parametrize("scripted", (False, True))
+def test_debounce_with_repeat_handed_the_key(async_redis, redis_, scripted):
+
+    lock = AsyncLock(async_redis, scripted=scripted, hook=Mock())
+    counts = []
+
+    @lock.debounce(repeat=True, latest=True)
+    async def func(*args, **kwargs):
+        counts.append((args, await async_redis.get("lock:func(egg)")))
+        if len(counts) == 1:
+            # simulate locking attempt with newer arguments
+            latest = lock.serializer.dumps([["egg", 2], {}])
+            await lock.acquire("func(egg)", latest=latest)
+
+    asyncio.run(func("egg", 1))
+
+    # the repeat held the key without acquiring it again
+    assert [(("egg", 1), b"1"), (("egg", 2), b"1")] == counts
+    events = [args[0] for args, _ in lock.hook.call_args_list]
+    assert 1 == events.count("acquire_time")
+    assert not redis_.exists("lock:func(egg):latest")
+    assert scripted != bool(redis_.exists("lock:func(egg)"))
+
+
+def test_debounce_with_max_repeats_exhausted(async_redis, tracker):
+
+    hook = Mock()
+    lock = AsyncLock(async_redis, hook=hook)
+
+    @lock.debounce(repeat=True, max_repeats=0)
+    async def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        await async_redis.incr("lock:func(egg)")
+
+    asyncio.run(func("egg"))
+
+    assert 1 == tracker.call_count
+    assert call("exhausted", "func", None) in hook.call_args_list
+
+
+def test_skip_duplicates_with_custom_key(async_redis, redis_, tracker):
+
+    lock = AsyncLock(async_redis)
+
+    @lock.skip_duplicates(key=lambda _, spam: "yo:{}".format(spam.upper()))
+    async def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        return tracker
+
+    async def scenario():
+        assert tracker == await func("egg", spam="ham")
+        assert await func("bacon", spam="ham") is None
+
+    asyncio.run(scenario())
+
+    assert b"2" == redis_.get("lock:yo:HAM")
+
+    assert 1 == tracker.call_count
+    assert call("egg", spam="ham") == tracker.call_args
+
+
+class TestApi:
+    @pytest.fixture(params=("func", "meth", "meth_using_instance_client"))
+    def decorate(self, request, async_redis):
+        def decorate(decorator, **options):
+            def _decorate(func):
+                @decorator(async_redis, **options)
+                async def spam(*args, **kwargs):
+                    return await func(*args, **kwargs)
+
+                class Spam:
+                    @decorator(async_redis, **options)
+                    async def spam(self, *args, **kwargs):
+                        return await func(*args, **kwargs)
+
+                class SpamWithClientOnInstance:
+
+                    redis = async_redis
+
+                    @decorator(operator.attrgetter("redis"), **options)
+                    async def spam(self, *args, **kwargs):
+                        return await func(*args, **kwargs)
+
+                samples = {
+                    "func": spam,
+                    "meth": Spam().spam,
+                    "meth_using_instance_client": SpamWithClientOnInstance().spam,
+                }
+                return samples[request.param]
+
+            return _decorate
+
+        return decorate
+
+    def test_debounce(self, decorate, redis_, tracker):
+        release = asyncio.Event()
+
+        @decorate(debounce)
+        async def spam(*args, **kwargs):
+            tracker(*args, **kwargs)
+            await release.wait()
+            return tracker
+
+        async def scenario():
+            task = asyncio.ensure_future(spam("egg", spam="ham"))
+            await asyncio.sleep(0.1)
+
+            # the lock is held while the coroutine is running
+            assert b"1" == redis_.get("lock:spam(egg)")
+            assert await spam("egg", spam="ham") is None
+
+            release.set()
+            assert tracker == await task
+
+        asyncio.run(scenario())
+
+        assert b"0" == redis_.get("lock:spam(egg)")
+
+        assert 1 == tracker.call_count
+        assert call("egg", spam="ham") == tracker.call_args
+
+    def test_skip_duplicates(self, decorate, redis_, tracker):
+        @decorate(skip_duplicates)
+        async def spam(*args, **kwargs):
+            tracker(*args, **kwargs)
+            return tracker
+
+        async def scenario():
+            assert tracker == await spam("egg", spam="ham")
+            assert await spam("egg", spam="ham") is None
+
+        asyncio.run(scenario())
+
+        assert b"2" == redis_.get("lock:spam(egg)")
+
+        assert 1 == tracker.call_count
+        assert call("egg", spam="ham") == tracker.call_args
+
+
+def test_hook(async_redis, tracker):
+
+    hook = Mock()
+
+    @debounce(async_redis, hook=hook)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    async def scenario():
+        await spam("egg")
+        await async_redis.incr("lock:spam(egg)")
+        await spam("egg")
+
+    asyncio.run(scenario())
+
+    assert [
+        call("acquire_time", "spam", ANY),
+        call("acquired", "spam", None),
+        call("call_time", "spam", ANY),
+        call("release_time", "spam", ANY),
+        call("acquire_time", "spam", ANY),
+        call("skipped", "spam", None),
+    ] == hook.call_args_list
+
+
+def test_throttle(async_redis, redis_, tracker):
+
+    hook = Mock()
+
+    @throttle(async_redis, limit=2, per=10, hook=hook)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        return tracker
+
+    async def scenario():
+        assert tracker == await spam("egg")
+        assert tracker == await spam("egg")
+        assert await spam("egg") is None
+
+    asyncio.run(scenario())
+
+    assert 2 == redis_.zcard("lock:spam(egg):throttle")
+    assert 2 == tracker.call_count
+    assert call("throttled", "spam", None) == hook.call_args
+
+
+def test_throttle_with_delay(async_redis, tracker):
+
+    @AsyncLock(async_redis).throttle(per=0.1, delay=True)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    async def scenario():
+        await spam("egg")
+        await spam("egg")
+
+    asyncio.run(scenario())
+
+    assert [call("egg"), call("egg")] == tracker.call_args_list
+
+
+def test_lease(async_redis, redis_):
+
+    @AsyncLock(async_redis, default_ttl=1, renew=True).debounce
+    async def spam(*args, **kwargs):
+        await asyncio.sleep(1.5)
+        return await async_redis.get("lock:spam(egg)")
+
+    @AsyncLock(async_redis, default_ttl=1, renew=True).skip_duplicates
+    async def ham(*args, **kwargs):
+        await asyncio.sleep(1.5)
+        return await async_redis.get("lock:ham(egg)")
+
+    async def scenario():
+        # outlived default_ttl, still held
+        assert b"1" == await spam("egg")
+        assert b"0" == await async_redis.get("lock:spam(egg)")
+        assert b"1" == await ham("egg")
+
+    asyncio.run(scenario())
+
+    assert 0 < redis_.ttl("lock:ham(egg)") <= 1
+
+
+def test_failing_lease_renewal(async_redis, caplog):
+
+    lock = AsyncLock(async_redis, default_ttl=1, renew=True)
+    lock.backend = Mock(wraps=lock.backend)
+    lock.backend.extend.side_effect = Exception("Whoops")
+
+    @lock.skip_duplicates
+    async def spam(*args, **kwargs):
+        await asyncio.sleep(0.5)
+
+    asyncio.run(spam("egg"))
+
+    assert lock.backend.extend.called
+    assert "Failed renewing lock:spam(egg)" in caplog.text
+
+
+def test_share(async_redis, tracker):
+
+    @debounce(async_redis, share=1)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        await asyncio.sleep(0.2)
+        return "ham"
+
+    @skip_duplicates(async_redis, share=1)
+    async def ham(*args, **kwargs):
+        await asyncio.sleep(0.2)
+        raise ValueError("Whoops")
+
+    async def scenario():
+        assert ["ham", "ham"] == await asyncio.gather(spam("egg"), spam("egg"))
+        outcomes = await asyncio.gather(ham("egg"), ham("egg"), return_exceptions=True)
+        assert {ValueError, SharedCallError} == set(map(type, outcomes))
+        # shared for as long as the key is held
+        with pytest.raises(SharedCallError):
+            await ham("egg")
+
+    asyncio.run(scenario())
+
+    assert [call("egg")] == tracker.call_args_list
+
+
+def test_share_timeout(async_redis, caplog):
+
+    @AsyncLock(async_redis).skip_duplicates(share=0.1)
+    async def spam(*args, **kwargs):
+        await asyncio.sleep(0.3)
+        return object()
+
+    async def scenario():
+        # either one may be first to reach Redis
+        outcomes = await asyncio.gather(spam("egg"), spam("egg"))
+        assert 1 == outcomes.count(None)
+
+    asyncio.run(scenario())
+
+    assert "Failed sharing outcome of lock:spam(egg):result" in caplog.text
+
+
+def test_coalesce(async_redis, redis_, tracker):
+
+    lock = AsyncLock(async_redis, coalesce=True)
+    lock.backend = Mock(wraps=lock.backend)
+
+    @lock.debounce(repeat=True)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        await asyncio.sleep(0.1)
+
+    async def scenario():
+        await asyncio.gather(*(spam("egg") for _ in range(5)))
+
+    asyncio.run(scenario())
+
+    assert [call("egg"), call("egg")] == tracker.call_args_list
+    assert 2 == lock.backend.acquire.call_count
+    assert {} == lock.in_flight
+
+
+def test_coalesce_held_elsewhere(async_redis, redis_, tracker):
+
+    lock = AsyncLock(async_redis, coalesce=True)
+    lock.backend = Mock(wraps=lock.backend)
+
+    @lock.debounce
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    async def scenario():
+        await async_redis.incr("lock:spam(egg)")
+        assert await spam("egg") is None
+
+        lock.backend.acquire.side_effect = ConnectionError("Whoops")
+        with pytest.raises(ConnectionError):
+            await spam("ham")
+        assert {} == lock.in_flight
+
+        lock.backend.acquire.side_effect = None
+        lock.backend.release.side_effect = ConnectionError("Whoops")
+        with pytest.raises(ConnectionError):
+            await spam("ham")
+        assert {} == lock.in_flight
+
+    asyncio.run(scenario())
+
+    assert [call("ham")] == tracker.call_args_list
+
+
+def test_near_cache(async_redis, tracker):
+
+    lock = AsyncLock(async_redis, near_cache=10)
+    lock.backend = Mock(wraps=lock.backend)
+
+    @lock.skip_duplicates
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    async def scenario():
+        await spam("egg")
+        await spam("egg")
+
+    asyncio.run(scenario())
+
+    assert [call("egg")] == tracker.call_args_list
+    assert 1 == lock.backend.acquire.call_count
+
+
+def test_memoize(async_redis, redis_, tracker, caplog):
+
+    @debounce(async_redis, result_ttl=60)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        return args[0] if args[0] == "egg" else tracker
+
+    async def scenario():
+        assert "egg" == await spam("egg")
+        assert "egg" == await spam("egg")
+        assert tracker == await spam("ham")
+        assert tracker == await spam("ham")
+
+    asyncio.run(scenario())
+
+    assert [call("egg"), call("ham"), call("ham")] == tracker.call_args_list
+    assert b'{"result": "egg"}' == redis_.get("lock:spam(egg):memo")
+    assert "Failed memoizing result of lock:spam(ham):memo" in caplog.text
+
+
+def test_block(async_redis, redis_, tracker):
+
+    @debounce(async_redis, block=5)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        await asyncio.sleep(0.1)
+        return tracker.call_count
+
+    @AsyncLock(async_redis).debounce(block=0.1)
+    async def ham(*args, **kwargs):
+        await asyncio.sleep(0.3)
+
+    async def scenario():
+        assert [1, 2] == sorted(await asyncio.gather(spam("egg"), spam("egg")))
+        assert [None, None] == await asyncio.gather(ham("egg"), ham("egg"))
+
+    asyncio.run(scenario())
+
+    assert [call("egg"), call("egg")] == tracker.call_args_list
+    assert 1 == redis_.llen("lock:spam(egg):wake")
+
+
+def test_latest(async_redis, redis_, tracker):
+
+    callback = Mock()
+
+    @debounce(
+        async_redis,
+        key=lambda *args, **kwargs: "spam",
+        repeat=True,
+        callback=callback,
+        latest=True,
+    )
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        await asyncio.sleep(0.1)
+
+    async def scenario():
+        held = asyncio.ensure_future(spam("egg"))
+        await asyncio.sleep(0.05)
+        await spam("ham", spam=1)
+        await spam("spam", spam=2)
+        await held
+
+        assert [call("egg"), call("spam", spam=2)] == tracker.call_args_list
+        assert [call("spam", spam=2)] == callback.call_args_list
+
+        await spam("egg")
+        assert call("egg") == tracker.call_args
+
+    asyncio.run(scenario())
+
+    assert 3 == tracker.call_count
+    assert redis_.get("lock:spam:latest") is None
+
+
+def test_latest_callback(async_redis, tracker):
+
+    callback = Mock()
+    lock = AsyncLock(async_redis)
+
+    @lock.debounce(callback=callback, latest=True)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        latest = lock.serializer.dumps([["egg", 2], {}])
+        await lock.acquire("spam(egg)", latest=latest)
+
+    asyncio.run(spam("egg", 1))
+
+    assert [call("egg", 1)] == tracker.call_args_list
+    assert [call("egg", 2)] == callback.call_args_list
+
+
+def test_failing_call_not_handed_the_key(async_redis, redis_):
+
+    @AsyncLock(async_redis).debounce(repeat=True)
+    async def spam(*args, **kwargs):
+        # simulate locking attempt
+        await async_redis.incr("lock:spam(egg)")
+        raise ValueError("Whoops")
+
+    with pytest.raises(ValueError):
+        asyncio.run(spam("egg"))
+
+    # released, dropping the pending turn
+    assert b"0" == redis_.get("lock:spam(egg)")
+
+
+def test_debounce_batch(async_redis, redis_, tracker):
+
+    @debounce_batch(async_redis, max_batch=2)
+    async def spam(items):
+        tracker(items)
+        await asyncio.sleep(0.1)
+
+    async def scenario():
+        held = asyncio.ensure_future(spam("egg"))
+        await asyncio.sleep(0.05)
+        for item in ("ham", "spam", "bacon"):
+            assert await spam(item) is None
+        await held
+
+        with pytest.raises(TypeError):
+            await spam("egg", "ham")
+
+    asyncio.run(scenario())
+
+    assert [
+        call(["egg"]),
+        call(["ham", "spam"]),
+        call(["bacon"]),
+    ] == tracker.call_args_list
+
+
+def test_debounce_batch_repeated(async_redis, redis_, tracker):
+
+    lock = AsyncLock(async_redis)
+    release = lock.backend.release
+
+    async def late_release(key, ttl):
+        if tracker.call_count == 1:
+            await lock.backend.acquire_batch(key, ttl, '"ham"')
+        return await release(key, ttl)
+
+    lock.backend.release = late_release
+
+    @lock.debounce_batch
+    async def spam(items):
+        tracker(items)
+
+    asyncio.run(spam("egg"))
+
+    assert [call(["egg"]), call(["ham"])] == tracker.call_args_list
+
+
+def test_executor(async_redis, tracker):
+
+    tasks = []
+
+    def executor(func, *args):
+        tasks.append(asyncio.ensure_future(func(*args)))
+
+    callback = Mock(side_effect=[None, Exception("Whoops")])
+
+    lock = AsyncLock(async_redis, executor=executor)
+
+    @lock.debounce(repeat=True, callback=callback)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        if tracker.call_count in (1, 3):
+            await async_redis.incr("lock:spam(egg)")
+        return tracker.call_count
+
+    async def scenario():
+        assert 1 == await spam("egg")
+        assert 1 == tracker.call_count
+        # the repeat acquires the key once run
+        assert 0 == (await lock.status("spam(egg)")).count
+        await asyncio.gather(*tasks)
+        assert 2 == tracker.call_count
+
+        # failures of follow ups are logged
+        assert 3 == await spam("egg")
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+    assert 2 == callback.call_count
+
+
+def test_status(async_redis):
+
+    lock = AsyncLock(async_redis, 30)
+
+    async def scenario():
+        await lock.acquire("spam")
+        await lock.acquire("spam")
+        await async_redis.set("lock:egg", "not a counter")
+        assert (2, 30) == await lock.status("spam")
+        assert [(None, None), (0, None)] == await lock.status_many(["egg", "ham"])
+
+    asyncio.run(scenario())
+
+
+def test_cluster_clients_hash_tagged(async_redis):
+
+    assert not AsyncLock(async_redis).hash_tag
+    assert AsyncLock(Mock(spec=RedisCluster)).hash_tag
@@ -0,0 +1,597 @@
+import asyncio
+import threading
+import time
+
+from mock import call, Mock
+import pytest
+
+from ddebounce import (
+    AsyncLock,
+    Backend,
+    debounce,
+    debounce_batch,
+    Lock,
+    MemoryBackend,
+    skip_duplicates,
+    throttle,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def backend(clock):
+    return MemoryBackend(clock=clock)
+
+
+def test_acquire_and_release(backend):
+
+    assert 1 == backend.acquire("101", 30)
+    assert 2 == backend.acquire("101", 30)
+    assert 1 == backend.acquire("102", 30)
+
+    assert 2 == backend.release("101", 30)
+    assert 1 == backend.acquire("101", 30)
+
+    assert 1 == backend.release("102", 30)
+    assert 0 == backend.release("wat", 30)  # never acquired
+
+
+def test_uncontended_release_drops_key(backend):
+
+    backend.acquire("101", 30)
+    backend.acquire("101", 30)
+
+    backend.release("101", 30)
+    assert "101" in backend.counters
+
+    backend.release("101", 30)
+    assert "101" not in backend.counters
+
+
+def test_expiration(backend, clock):
+
+    assert 1 == backend.acquire("101", 1)
+    assert 2 == backend.acquire("101", 1)
+
+    clock.now = 0.9
+    assert 3 == backend.acquire("101", 1)  # renews the ttl
+
+    clock.now = 2
+    assert 1 == backend.acquire("101", 1)
+
+    clock.now = 3
+    assert 0 == backend.release("101", 1)
+
+
+def test_extend(backend, clock):
+
+    backend.acquire("101", 1)
+
+    clock.now = 0.9
+    assert backend.extend("101", 1) is True
+
+    clock.now = 1.5
+    assert 1 == backend.get("101")
+
+    clock.now = 2
+    assert backend.extend("101", 1) is False
+    assert backend.extend("102", 1) is False
+    assert 0 == backend.get("101")
+
+
+def test_latest(backend, clock):
+
+    assert 1 == backend.acquire_latest("101", 10, "egg")
+    assert 2 == backend.acquire_latest("101", 10, "ham")
+    assert (2, "ham") == backend.release_latest("101", 10)
+    assert (0, None) == backend.release_latest("101", 10)
+
+    assert 1 == backend.acquire_latest("101", 10, "egg")
+    assert (1, "egg") == backend.release_latest("101", 10)
+    assert "101" not in backend.counters
+
+    backend.acquire_latest("101", 10, "egg")
+    clock.now = 10
+    assert (0, None) == backend.release_latest("101", 10)
+
+
+def test_batch(backend, clock):
+
+    assert [] == backend.drain("101", 10)
+
+    assert 1 == backend.acquire_batch("101", 10, "egg")
+    assert 2 == backend.acquire_batch("101", 10, "ham")
+    assert 3 == backend.acquire_batch("101", 10, "spam")
+    assert ["egg", "ham"] == backend.drain("101", 2)
+    assert ["spam"] == backend.drain("101", 2)
+    assert [] == backend.drain("101", 2)
+
+    backend.acquire_batch("101", 10, "egg")
+    clock.now = 10
+    assert [] == backend.drain("101", 2)
+    backend.acquire_batch("101", 10, "ham")
+    assert ["ham"] == backend.drain("101", 2)
+
+
+def test_notify_and_wait(backend, clock):
+
+    assert backend.wait("101", 0.01) is False
+
+    # a single token is kept
+    backend.notify("101", 10)
+    backend.notify("101", 10)
+    assert backend.wait("101", 0.01) is True
+    assert backend.wait("101", 0.01) is False
+
+    backend.notify("101", 10)
+    clock.now = 10
+    assert backend.wait("101", 0.01) is False
+
+
+def test_blocking_acquire(backend):
+
+    lock = Lock(backend)
+
+    assert lock.acquire("101") is True
+    timer = threading.Timer(0.1, lock.release, ("101",))
+    timer.start()
+
+    assert lock.acquire("101", wait=5) is True
+    timer.join()
+
+
+def test_store_and_load(backend, clock):
+
+    assert backend.load("101") is None
+
+    backend.store("101", "egg", 10)
+    assert "egg" == backend.load("101")
+
+    clock.now = 10
+    assert backend.load("101") is None
+
+
+def test_publish_and_receive(backend, clock):
+
+    assert backend.receive("101", 0.01) is None
+
+    backend.publish("101", "egg", 10)
+    assert "egg" == backend.receive("101", 0.01)
+
+    clock.now = 10
+    assert backend.receive("101", 0.01) is None
+
+
+def test_take(backend):
+
+    assert backend.take("101", 10)
+    assert not backend.take("101", 10)
+    # counted no turn
+    assert 1 == backend.release("101", 10)
+
+    backend.acquire("101", 10)
+    backend.acquire("101", 10)
+    backend.publish("101:result", "egg", 10)
+    assert 2 == backend.release("101", 10)
+    assert backend.take("101", 10, shared=True)
+    assert backend.receive("101:result", 0.01) is None
+
+
+def test_acquire_shared(backend, clock):
+
+    backend.publish("101:result", "egg", 10)
+    assert 1 == backend.acquire_shared("101", 10)
+    # withdrawn by the first caller
+    assert backend.receive("101:result", 0.01) is None
+
+    backend.publish("101:result", "ham", 10)
+    clock.now = 5
+    assert 2 == backend.acquire_shared("101", 10, "spam")
+    assert "spam" == backend.latest["101"][0]
+
+    # renewed along with the key
+    clock.now = 14
+    assert "ham" == backend.receive("101:result", 0.01)
+    clock.now = 15
+    assert backend.receive("101:result", 0.01) is None
+
+    # expired outcomes stay expired
+    assert 1 == backend.acquire_shared("101", 10)
+    assert 2 == backend.acquire_shared("101", 10)
+    assert "101:result" not in backend.published
+
+
+def test_receive_waits(backend):
+
+    timer = threading.Timer(0.1, backend.publish, ("101", "egg", 10))
+    timer.start()
+
+    assert "egg" == backend.receive("101", 1)
+    timer.join()
+
+
+def test_sweep_drops_expired_keys(backend, clock):
+
+    backend.acquire("101", 1)
+    backend.acquire("102", 120)
+
+    clock.now = MemoryBackend.sweep_interval
+    backend.acquire("103", 1)
+
+    assert {"102", "103"} == set(backend.counters)
+
+
+def test_sweep_drops_expired_outcomes(backend, clock):
+
+    backend.publish("101", "egg", 10)
+    backend.store("102", "ham", 10)
+    backend.notify("103", 10)
+    backend.acquire_latest("105", 10, "bacon")
+    backend.acquire_batch("106", 10, "bacon")
+    clock.now = MemoryBackend.sweep_interval
+    backend.acquire("104", 10)
+
+    assert {} == backend.published
+    assert {} == backend.stored
+    assert {} == backend.tokens
+    assert {} == backend.latest
+    assert {} == backend.batches
+
+
+def test_thread_safety():
+
+    backend = MemoryBackend()
+
+    counts = []
+
+    def acquire():
+        for _ in range(1000):
+            counts.append(backend.acquire("101", 30))
+
+    threads = [threading.Thread(target=acquire) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert list(range(1, 8001)) == sorted(counts)
+
+
+def test_lock(backend):
+
+    lock = Lock(backend)
+
+    assert lock.acquire("101") is True
+    assert lock.acquire("101") is False
+
+    assert lock.release("101") is True
+    assert lock.acquire("101") is True
+    assert lock.release("101") is False
+
+    assert "lock:101" not in backend.counters
+
+
+def test_debounce_with_repeat(backend):
+
+    tracker = Mock()
+
+    @debounce(backend, repeat=True)
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        if tracker.call_count == 1:
+            # simulate locking attempt
+            backend.acquire("lock:spam(egg)", 30)
+        return tracker
+
+    assert tracker == spam("egg", spam="ham")
+
+    assert [call("egg", spam="ham"), call("egg", spam="ham")] == tracker.call_args_list
+
+
+def test_skip_duplicates(backend):
+
+    tracker = Mock()
+
+    @skip_duplicates(backend)
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        return tracker
+
+    assert tracker == spam("egg", spam="ham")
+    assert spam("egg", spam="ham") is None
+
+    assert 1 == tracker.call_count
+
+
+def test_async_lock(backend):
+
+    lock = AsyncLock(backend)
+
+    async def scenario():
+        assert await lock.acquire("101") is True
+        assert await lock.acquire("101") is False
+        assert await lock.release("101") is True
+
+    asyncio.run(scenario())
+
+
+def test_backend_is_abstract():
+
+    class Incomplete(Backend):
+        def acquire(self, key, ttl):
+            return 1
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_time_windows_are_optional():
+    class Counting(Backend):
+        def acquire(self, key, ttl):
+            return 1
+
+        def release(self, key, ttl):
+            return 1
+
+    backend = Counting()
+
+    with pytest.raises(NotImplementedError):
+        backend.schedule("windows", "101", 0, 30)
+    with pytest.raises(NotImplementedError):
+        backend.due("windows", 0, 100)
+    with pytest.raises(NotImplementedError):
+        backend.extend("101", 30)
+    with pytest.raises(NotImplementedError):
+        backend.acquire_latest("101", 30, "egg")
+    with pytest.raises(NotImplementedError):
+        backend.release_latest("101", 30)
+    with pytest.raises(NotImplementedError):
+        backend.acquire_batch("101", 30, "egg")
+    with pytest.raises(NotImplementedError):
+        backend.drain("101", 10)
+    with pytest.raises(NotImplementedError):
+        backend.notify("101", 30)
+    with pytest.raises(NotImplementedError):
+        backend.wait("101", 1)
+    with pytest.raises(NotImplementedError):
+        backend.store("101", "egg", 30)
+    with pytest.raises(NotImplementedError):
+        backend.load("101")
+    with pytest.raises(NotImplementedError):
+        backend.acquire_shared("101", 30)
+    with pytest.raises(NotImplementedError):
+        backend.take("101", 30)
+    with pytest.raises(NotImplementedError):
+        backend.publish("101", "egg", 30)
+    with pytest.raises(NotImplementedError):
+        backend.receive("101", 1)
+    with pytest.raises(NotImplementedError):
+        backend.hit("101", 0, 1, 1)
+    with pytest.raises(NotImplementedError):
+        backend.handoff("101", 30)
+    with pytest.raises(NotImplementedError):
+        backend.handoff_latest("101", 30)
+    with pytest.raises(NotImplementedError):
+        backend.status(["101"])
+    with pytest.raises(NotImplementedError):
+        backend.scan("*", 1000)
+    with pytest.raises(NotImplementedError):
+        backend.purge(["101"])
+
+
+def test_lock_scripted_backend(backend):
+
+    with pytest.raises(ValueError):
+        Lock(backend, scripted=True)
+
+
+def test_time_windows(backend):
+
+    assert backend.schedule("windows", "101", 10, 30, "egg") is False
+    assert backend.schedule("windows", "101", 20, 30, "ham") is True
+    assert backend.schedule("windows", "102", 15, 30, "spam", leading=True) is False
+    assert backend.schedule("windows", "103", 12, 30, "bacon") is False
+
+    assert [] == backend.due("windows", 9, 100)
+    assert [] == backend.due("other", 30, 100)
+
+    # by deadline, limited, skipping windows without a pending call
+    assert [("103", "bacon")] == backend.due("windows", 30, 2)
+    assert [("101", "ham")] == backend.due("windows", 30, 2)
+    assert [] == backend.due("windows", 30, 2)
+
+
+def test_debounce_over_time_window(backend):
+
+    tracker = Mock()
+
+    @debounce(backend, wait=0.1)
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    spam("egg", spam="ham")
+    spam("egg", spam="spam")
+
+    time.sleep(0.15)
+
+    assert 1 == Lock(backend).run_due()
+    assert [call("egg", spam="spam")] == tracker.call_args_list
+
+
+def test_async_lock_time_window(backend):
+
+    with pytest.raises(ValueError):
+
+        @AsyncLock(backend).debounce(wait=1)
+        async def spam():
+            pass  # pragma: no cover
+
+
+def test_hit(backend, clock):
+
+    assert 0 == backend.hit("101", 100, 2, 10)
+    assert 0 == backend.hit("101", 105, 2, 10)
+    assert 4 == backend.hit("101", 106, 2, 10)
+    assert 0 == backend.hit("102", 106, 2, 10)
+
+    assert 0 == backend.hit("101", 110.5, 2, 10)
+    assert 4.5 == backend.hit("101", 110.5, 2, 10)
+
+
+def test_sweep_drops_expired_hits(backend, clock):
+
+    backend.hit("101", 0, 1, 10)
+    clock.now = MemoryBackend.sweep_interval
+    backend.hit("102", clock.now, 1, 10)
+
+    assert ["102"] == list(backend.hits)
+
+
+def test_throttle(backend):
+
+    tracker = Mock()
+
+    @throttle(backend, per=10)
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    spam("egg")
+    spam("egg")
+
+    assert [call("egg")] == tracker.call_args_list
+
+
+def test_async_lock_throttle(backend):
+
+    tracker = Mock()
+
+    @AsyncLock(backend).throttle(per=0.1, delay=True)
+    async def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    async def scenario():
+        await spam("egg")
+        await spam("egg")
+
+    asyncio.run(scenario())
+
+    assert [call("egg"), call("egg")] == tracker.call_args_list
+
+
+def test_skip_duplicates_shared(backend):
+
+    @skip_duplicates(backend, share=1)
+    def spam(*args, **kwargs):
+        time.sleep(0.2)
+        return "ham"
+
+    thread = threading.Thread(target=spam, args=("egg",))
+    thread.start()
+    time.sleep(0.1)
+
+    assert "ham" == spam("egg")
+    thread.join()
+
+
+def test_memoized(backend):
+
+    tracker = Mock()
+
+    @debounce(backend, result_ttl=60)
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        return "ham"
+
+    assert "ham" == spam("egg")
+    assert "ham" == spam("egg")
+    assert 1 == tracker.call_count
+
+
+def test_debounce_batch(backend):
+
+    tracker = Mock()
+
+    @debounce_batch(backend)
+    def spam(items):
+        tracker(items)
+
+    spam("egg")
+    spam("ham")
+
+    assert [call(["egg"]), call(["ham"])] == tracker.call_args_list
+
+
+def test_status(backend, clock):
+
+    backend.acquire("101", 30)
+    backend.acquire("101", 30)
+    backend.store("102", "payload", 20)
+    backend.acquire("103", 10)
+
+    clock.now = 5
+
+    assert [(2, 25), (None, 15), (1, 5), (0, None)] == backend.status(
+        ["101", "102", "103", "104"]
+    )
+
+    clock.now = 10
+    assert [(0, None)] == backend.status(["103"])
+
+
+def test_scan_and_purge(backend, clock):
+
+    backend.acquire("lock:101", 30)
+    backend.acquire_batch("lock:102", 30, "payload")
+    backend.store("lock:102:memo", "payload", 30)
+    backend.acquire("other:103", 30)
+    backend.acquire("lock:104", 10)
+
+    clock.now = 10
+
+    assert ["lock:101", "lock:102", "lock:102:memo"] == list(
+        backend.scan("lock:*", 1000)
+    )
+    assert ["lock:102"] == list(backend.scan("lock:10[2-3]", 1000))
+
+    assert 1 == backend.purge(["lock:102", "lock:104", "lock:105"])
+    assert ["lock:101", "lock:102:memo"] == list(backend.scan("lock:*", 1000))
+
+
+def test_handoff(backend, clock):
+
+    backend.acquire("101", 30)
+    backend.acquire("101", 30)
+
+    # kept held, with its turns reset
+    assert 2 == backend.handoff("101", 30)
+    assert 2 == backend.acquire("101", 30)
+
+    backend.release("101", 30)
+    backend.acquire("101", 30)
+    assert 1 == backend.handoff("101", 30)
+    assert 1 == backend.acquire("101", 30)
+
+
+def test_handoff_latest(backend, clock):
+
+    backend.acquire_latest("101", 30, "egg")
+    backend.acquire_latest("101", 30, "ham")
+
+    assert (2, "ham") == backend.handoff_latest("101", 30)
+    assert (1, None) == backend.handoff_latest("101", 30)
+
+    backend.acquire_latest("101", 30, "egg")
+    clock.now = 30
+    assert (0, None) == backend.handoff_latest("101", 30)
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+from mock import AsyncMock, call, Mock
+import pytest
+import redis.asyncio.cluster
+import redis.cluster
+
+from ddebounce import AsyncLock, debounce, Lock, skip_duplicates, throttle
+from ddebounce.aio import AsyncRedisBackend
+from ddebounce.backends import RedisBackend
+
+
+def test_publish_outside_pipelines():
+
+    client = Mock(spec=redis.cluster.RedisCluster)
+
+    RedisBackend(client).publish("{101}:result", "egg", 30)
+
+    assert [
+        call.set("{101}:result", "egg", ex=30),
+        call.publish("{101}:result", "egg"),
+    ] == [entry for entry in client.mock_calls if entry[0] in ("set", "publish")]
+    assert not client.pipeline.called
+
+
+def test_async_publish_outside_pipelines():
+
+    client = Mock(spec=redis.asyncio.cluster.RedisCluster)
+    client.set, client.publish = AsyncMock(), AsyncMock()
+
+    asyncio.run(AsyncRedisBackend(client).publish("{101}:result", "egg", 30))
+
+    assert [call("{101}:result", "egg", ex=30)] == client.set.call_args_list
+    assert [call("{101}:result", "egg")] == client.publish.call_args_list
+    assert not client.pipeline.called
+
+
+def test_time_windows_rejected():
+
+    lock = Lock(Mock(spec=redis.cluster.RedisCluster))
+
+    with pytest.raises(ValueError):
+
+        @lock.debounce(wait=1)
+        def func(*args, **kwargs):
+            pass
+
+
+def test_shared(redis_cluster):
+
+    tracker = Mock()
+
+    @skip_duplicates(redis_cluster, share=1)
+    def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        time.sleep(0.2)
+        return "ham"
+
+    outcome = []
+    thread = threading.Thread(target=lambda: outcome.append(func("egg")))
+    thread.start()
+    time.sleep(0.1)
+
+    assert "ham" == func("egg")
+    thread.join()
+    assert ["ham"] == outcome
+    assert 1 == tracker.call_count
+
+
+@pytest.mark.parametrize("scripted", (False, True))
+def test_debounce(redis_cluster, scripted):
+
+    tracker, callback = Mock(), Mock()
+
+    @debounce(
+        redis_cluster, repeat=True, callback=callback, latest=True, scripted=scripted
+    )
+    def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        if tracker.call_count == 1:
+            func("egg", spam="ham")
+        return "ham"
+
+    assert "ham" == func("egg")
+
+    assert [call("egg"), call("egg", spam="ham")] == tracker.call_args_list
+    assert [call("egg", spam="ham")] == callback.call_args_list
+
+
+def test_throttle(redis_cluster):
+
+    @throttle(redis_cluster, limit=1, per=10)
+    def func(*args, **kwargs):
+        return "ham"
+
+    assert "ham" == func("egg")
+    assert func("egg") is None
+
+
+def test_inspection(redis_cluster):
+
+    lock = Lock(redis_cluster)
+    lock.acquire("spam(1)")
+    lock.acquire("spam(1)")
+
+    assert (2, 30) == lock.status("spam(1)")
+    assert ["lock:{spam(1)}"] == list(lock.backend.scan("lock:{spam(*", 100))
+    assert 1 == lock.backend.purge(["lock:{spam(1)}"])
+
+
+def test_async(async_redis_cluster):
+
+    lock = AsyncLock(async_redis_cluster)
+
+    @lock.skip_duplicates(share=1)
+    async def func(*args, **kwargs):
+        await asyncio.sleep(0.1)
+        return "ham"
+
+    async def scenario():
+        try:
+            return await asyncio.gather(func("egg"), func("egg"))
+        finally:
+            await async_redis_cluster.aclose()
+
+    assert ["ham", "ham"] == asyncio.run(scenario())
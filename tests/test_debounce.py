@@ -1,10 +1,13 @@
+import gc
+import weakref
+
 import eventlet
 from eventlet.event import Event
 from mock import call, Mock, patch
 import operator
 import pytest
 
-from ddebounce import debounce
+from ddebounce import debounce, Lock, MemoryBackend
 
 
 @pytest.fixture
@@ -367,3 +370,90 @@ def test_custom_ttl(Lock):
     spam()
 
     assert Lock.call_args == call(redis_, 60)
+
+
+@patch("ddebounce.api.Lock", wraps=Lock)
+def test_lock_built_once(Lock, redis_):
+    @debounce(redis_)
+    def spam(*args, **kwargs):
+        pass
+
+    spam("egg")
+    spam("egg")
+
+    assert 1 == Lock.call_count
+
+
+@patch("ddebounce.api.Lock", wraps=Lock)
+def test_lock_built_once_per_client(Lock, redis_):
+    class Spam:
+
+        redis = redis_
+
+        @debounce(operator.attrgetter("redis"))
+        def spam(self, *args, **kwargs):
+            pass
+
+    first, second = Spam(), Spam()
+
+    first.spam("egg")
+    first.spam("egg")
+    second.spam("egg")
+
+    # instances resolving the same client share its lock
+    assert 1 == Lock.call_count
+
+    # a different client gets its own lock
+    first.redis = type(redis_)(connection_pool=redis_.connection_pool)
+    first.spam("egg")
+    second.spam("egg")
+
+    assert 2 == Lock.call_count
+    assert call(first.redis, None) == Lock.call_args
+
+    # cached locks keep neither instances nor clients alive
+    instance, client = weakref.ref(first), weakref.ref(first.redis)
+    del first
+    gc.collect()
+    assert instance() is None
+    assert client() is None
+
+
+def test_lock_options(redis_):
+
+    hook = Mock()
+
+    @debounce(redis_, hook=hook)
+    def spam(*args, **kwargs):
+        pass
+
+    spam("egg")
+
+    assert call("acquired", "spam", None) in hook.call_args_list
+
+
+@patch("ddebounce.api.Lock", wraps=Lock)
+def test_lock_built_per_call_for_unhashable_client(Lock, tracker):
+    class Unhashable(MemoryBackend):
+
+        __hash__ = None
+
+    class Spam:
+
+        redis = Unhashable()
+
+        @debounce(operator.attrgetter("redis"))
+        def spam(self, *args, **kwargs):
+            tracker(*args, **kwargs)
+            return tracker
+
+    spam = Spam().spam
+
+    assert tracker == spam("egg", spam="ham")
+    assert tracker == spam("egg", spam="ham")
+
+    assert 2 == tracker.call_count
+    assert [call("egg", spam="ham"), call("egg", spam="ham")] == tracker.call_args_list
+
+    # nothing could be cached, the lock is built on each call
+    assert 2 == Lock.call_count
@@ -0,0 +1,322 @@
+import asyncio
+import threading
+import time
+
+from mock import call, Mock
+import pytest
+import redis
+
+from ddebounce import AsyncLock, CircuitBreaker, Lock, MemoryBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class Down(MemoryBackend):
+    # fails lock operations until brought back up
+
+    def __init__(self):
+        super().__init__()
+        self.down = True
+        self.calls = 0
+
+    def acquire(self, key, ttl):
+        self.calls += 1
+        if self.down:
+            raise redis.ConnectionError("Connection refused")
+        return super().acquire(key, ttl)
+
+    def release(self, key, ttl):
+        self.calls += 1
+        if self.down:
+            raise redis.ConnectionError("Connection refused")
+        return super().release(key, ttl)
+
+
+@pytest.fixture
+def backend():
+    return Down()
+
+
+@pytest.fixture
+def tracker():
+    return Mock()
+
+
+def test_circuit_breaker():
+
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10, clock=clock)
+
+    assert "closed" == breaker.state
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.allow()
+
+    breaker.failure()
+    assert "open" == breaker.state
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert "half-open" == breaker.state
+    # a single trial call goes through
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.failure()
+    assert "open" == breaker.state
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.success()
+    assert "closed" == breaker.state
+
+    assert {"failures": 4, "rejected": 2, "opened": 1, "closed": 1} == breaker.stats
+
+
+def test_invalid_fallback(backend):
+
+    with pytest.raises(ValueError):
+        Lock(backend, fallback="ignore")
+
+
+def test_no_fallback(backend):
+    @Lock(backend).debounce
+    def spam(*args, **kwargs):
+        pass
+
+    with pytest.raises(redis.ConnectionError):
+        spam("egg")
+
+
+def test_fail_open(backend, tracker, caplog):
+
+    hook = Mock()
+    lock = Lock(backend, fallback="open", hook=hook)
+
+    @lock.debounce
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        return "ham"
+
+    assert "ham" == spam("egg")
+    assert [call("egg")] == tracker.call_args_list
+
+    # released by the fallback which acquired it
+    assert 1 == backend.calls
+    assert not lock.degraded
+    assert {"acquiring": 1} == lock.fallbacks
+    assert call("fallback", "spam", None) in hook.call_args_list
+    assert "Failed acquiring spam(egg)" in caplog.text
+
+
+def test_fail_closed(backend, tracker):
+
+    lock = Lock(backend, fallback="closed")
+
+    @lock.skip_duplicates
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    assert spam("egg") is None
+    assert not tracker.called
+    assert {"acquiring": 1} == lock.fallbacks
+
+
+def test_local(backend, tracker):
+
+    lock = Lock(backend, fallback="local")
+
+    @lock.debounce(repeat=True)
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+        if tracker.call_count == 1:
+            # skipped, the key is held in-process
+            assert spam(*args, **kwargs) is None
+
+    spam("egg")
+
+    assert [call("egg"), call("egg")] == tracker.call_args_list
+    # the repeat was handed the key held in-process
+    assert {"acquiring": 2} == lock.fallbacks
+
+
+def test_breaker_opens(backend, tracker):
+
+    breaker = CircuitBreaker(threshold=2)
+    lock = Lock(backend, fallback="open", breaker=breaker)
+
+    @lock.skip_duplicates
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    for _ in range(5):
+        spam("egg")
+
+    assert 5 == tracker.call_count
+    # Redis is left alone once the breaker opened
+    assert 2 == backend.calls
+    assert "open" == breaker.state
+    assert {"acquiring": 5} == lock.fallbacks
+
+
+def test_failing_release(backend, tracker, caplog):
+
+    lock = Lock(backend, fallback="open")
+
+    @lock.debounce
+    def spam(*args, **kwargs):
+        backend.down = True
+
+    backend.down = False
+    assert spam("egg") is None
+
+    assert 1 == lock.breaker.failures
+    assert {"releasing": 1} == lock.fallbacks
+    assert "Failed releasing spam(egg)" in caplog.text
+
+
+def test_slow_operations_trip_the_breaker(backend, tracker):
+
+    class Slow(MemoryBackend):
+        def acquire(self, key, ttl):
+            time.sleep(0.02)
+            return super().acquire(key, ttl)
+
+    lock = Lock(Slow(), fallback="open", slow_operation=0.01)
+
+    @lock.skip_duplicates
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    spam("egg")
+
+    assert tracker.called
+    assert 1 == lock.breaker.failures
+    assert not lock.fallbacks
+
+
+def test_waiting_for_a_release_is_not_slow(tracker):
+
+    breaker = CircuitBreaker(threshold=1)
+    lock = Lock(MemoryBackend(), fallback="open", breaker=breaker, slow_operation=0.05)
+    lock.acquire("spam(egg)")
+    timer = threading.Timer(0.2, lock.release, ("spam(egg)",))
+    timer.start()
+
+    @lock.debounce(block=1)
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    spam("egg")
+    timer.join()
+
+    assert tracker.called
+    assert "closed" == breaker.state
+    assert not lock.fallbacks
+
+
+def test_recovery(backend, tracker):
+
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=clock)
+    lock = Lock(backend, fallback="closed", breaker=breaker)
+
+    @lock.debounce
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    spam("egg")
+    backend.down = False
+    spam("egg")
+    assert not tracker.called
+
+    clock.now = 10
+    spam("egg")
+    assert tracker.called
+    assert "closed" == breaker.state
+
+
+class TestAsync:
+    def test_fail_open(self, backend, tracker):
+
+        lock = AsyncLock(backend, fallback="open")
+
+        @lock.debounce
+        async def spam(*args, **kwargs):
+            tracker(*args, **kwargs)
+            return "ham"
+
+        assert "ham" == asyncio.run(spam("egg"))
+        assert 1 == backend.calls
+        assert {"acquiring": 1} == lock.fallbacks
+
+    def test_fail_closed(self, backend, tracker):
+
+        hook = Mock()
+        breaker = CircuitBreaker(threshold=1)
+        lock = AsyncLock(backend, fallback="closed", hook=hook, breaker=breaker)
+
+        @lock.skip_duplicates
+        async def spam(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        assert asyncio.run(spam("egg")) is None
+        assert asyncio.run(spam("egg")) is None
+        assert not tracker.called
+        assert 1 == backend.calls
+        assert call("fallback", "spam", None) in hook.call_args_list
+
+    def test_local(self, backend, tracker):
+
+        lock = AsyncLock(backend, fallback="local")
+
+        @lock.debounce(repeat=True)
+        async def spam(*args, **kwargs):
+            tracker(*args, **kwargs)
+            if tracker.call_count == 1:
+                assert await spam(*args, **kwargs) is None
+
+        asyncio.run(spam("egg"))
+
+        assert [call("egg"), call("egg")] == tracker.call_args_list
+
+    def test_failing_release(self, backend, tracker):
+
+        lock = AsyncLock(backend, fallback="open", slow_operation=60)
+
+        @lock.debounce
+        async def spam(*args, **kwargs):
+            backend.down = True
+
+        backend.down = False
+        asyncio.run(spam("egg"))
+
+        assert {"releasing": 1} == lock.fallbacks
+
+    def test_waiting_for_a_release_is_not_slow(self, tracker):
+
+        breaker = CircuitBreaker(threshold=1)
+        lock = AsyncLock(
+            MemoryBackend(), fallback="open", breaker=breaker, slow_operation=0.05
+        )
+        asyncio.run(lock.acquire("spam(egg)"))
+        timer = threading.Timer(0.2, asyncio.run, (lock.release("spam(egg)"),))
+        timer.start()
+
+        @lock.debounce(block=1)
+        async def spam(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        asyncio.run(spam("egg"))
+        timer.join()
+
+        assert tracker.called
+        assert "closed" == breaker.state
+        assert not lock.fallbacks
@@ -1,9 +1,17 @@
+import concurrent.futures
+import json
+import pickle
+import threading
+import time
+
 import eventlet
 from eventlet.event import Event
-from mock import call, Mock
+from mock import ANY, call, Mock, patch
 import pytest
+from redis.cluster import RedisCluster
+from redis.crc import key_slot
 
-from ddebounce import Lock
+from ddebounce import Lock, SharedCallError, skip_duplicates
 
 
 def test_debounce(redis_):
@@ -278,6 +286,127 @@ def test_debounce_failing_on_callback_execution(redis_):
     assert call("egg", spam="ham") == callback_tracker.call_args
 
 
+def test_debounce_with_repeat_does_not_recurse(redis_):
+
+    lock = Lock(redis_)
+
+    tracker = Mock()
+
+    @lock.debounce(repeat=True)
+    def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        # simulate locking attempt for the first two thousand executions
+        if tracker.call_count <= 2000:
+            redis_.incr("lock:func(egg)")
+        return tracker
+
+    assert tracker == func("egg", spam="ham")
+
+    assert 2001 == tracker.call_count
+
+
+def test_debounce_with_max_repeats(redis_):
+
+    lock = Lock(redis_)
+
+    tracker, callback_tracker = Mock(), Mock()
+
+    @lock.debounce(repeat=True, callback=callback_tracker, max_repeats=3)
+    def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        # simulate locking attempt on every execution
+        redis_.incr("lock:func(egg)")
+        return tracker
+
+    assert tracker == func("egg", spam="ham")
+
+    # executed once plus three repeats, never giving up the lock in between
+    assert 4 == tracker.call_count
+    assert 4 == callback_tracker.call_count
+
+    assert b"0" == redis_.get("lock:func(egg)")
+
+
+def test_debounce_with_max_repeats_drops_pending_turns(redis_):
+
+    hook = Mock()
+    lock = Lock(redis_, hook=hook)
+
+    tracker, callback_tracker = Mock(), Mock()
+
+    @lock.debounce(repeat=True, callback=callback_tracker, max_repeats=0)
+    def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        # simulate locking attempt
+        redis_.incr("lock:func(egg)")
+        return tracker
+
+    assert tracker == func("egg", spam="ham")
+
+    assert 1 == tracker.call_count
+
+    # the skipped caller is reported through the callback and the hook
+    # but its turn is not kept, the key is left released
+    assert 1 == callback_tracker.call_count
+    assert call("exhausted", "func", None) in hook.call_args_list
+    assert b"0" == redis_.get("lock:func(egg)")
+
+    assert lock.acquire("func(egg)") is True
+
+
+def test_debounce_with_repeat_failing_to_acquire(redis_):
+
+    lock = Lock(redis_)
+
+    tracker = Mock()
+
+    def callback(*args, **kwargs):
+        # another process acquires before the repeat does
+        lock.acquire("func(egg)")
+
+    # blocking callers are let in between repeats, which re-acquire the key
+    @lock.debounce(repeat=True, callback=callback, block=1)
+    def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        if tracker.call_count == 1:
+            # simulate locking attempt
+            redis_.incr("lock:func(egg)")
+        return tracker
+
+    # the other process is in charge of the repeat
+    assert func("egg", spam="ham") is None
+
+    assert 1 == tracker.call_count
+    # held by the other process, counting the failed repeat attempt
+    assert b"2" == redis_.get("lock:func(egg)")
+
+
+@pytest.mark.parametrize("scripted", (False, True))
+def test_debounce_with_repeat_handed_the_key(redis_, scripted):
+
+    lock = Lock(redis_, scripted=scripted)
+    lock.acquire = Mock(wraps=lock.acquire)
+
+    counts = []
+
+    @lock.debounce(repeat=True)
+    def func(*args, **kwargs):
+        counts.append(redis_.get("lock:func(egg)"))
+        if len(counts) == 1:
+            # simulate locking attempt
+            redis_.incr("lock:func(egg)")
+
+    func("egg", spam="ham")
+
+    # the repeat held the key without acquiring it again
+    assert [b"1", b"1"] == counts
+    assert 1 == lock.acquire.call_count
+    if scripted:
+        assert not redis_.exists("lock:func(egg)")
+    else:
+        assert b"0" == redis_.get("lock:func(egg)")
+
+
 def test_skip_duplicates_success(redis_):
 
     lock = Lock(redis_)
@@ -434,3 +563,1415 @@ def test_complex_scenario(redis_):
 
     # P8 ...
     assert lock.acquire(key) is True
+
+
+class TestScripted:
+    @pytest.fixture
+    def lock(self, redis_):
+        return Lock(redis_, scripted=True)
+
+    def test_simple_acquire_and_release(self, lock):
+
+        assert lock.acquire("101") is True
+        assert lock.acquire("101") is False
+        assert lock.acquire("102") is True
+
+        assert lock.release("101") is True
+        assert lock.release("102") is False
+
+        assert lock.release("wat") is False  # never acquired
+
+    def test_release_deletes_uncontended_key(self, lock, redis_):
+
+        formatted_key = lock.format_key("101")
+
+        assert lock.acquire("101") is True
+        assert redis_.ttl(formatted_key) > 0
+
+        assert lock.release("101") is False
+
+        # ttl = -2 means that the key has gone
+        assert redis_.ttl(formatted_key) == -2
+
+    def test_release_keeps_contended_key(self, lock, redis_):
+
+        formatted_key = lock.format_key("101")
+
+        assert lock.acquire("101") is True
+        assert lock.acquire("101") is False
+
+        assert lock.release("101") is True
+
+        assert b"0" == redis_.get(formatted_key)
+        assert redis_.ttl(formatted_key) > 0
+
+        assert lock.acquire("101") is True
+        assert lock.release("101") is False
+
+        assert redis_.get(formatted_key) is None
+
+    def test_scripts_reloaded_after_flush(self, lock, redis_):
+
+        assert lock.acquire("101") is True
+
+        redis_.script_flush()
+
+        assert lock.acquire("101") is False
+        assert lock.release("101") is True
+
+    def test_debounce(self, lock, redis_):
+
+        tracker = Mock()
+        release = Event()
+
+        @lock.debounce(repeat=True)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            release.wait()
+            return tracker
+
+        thread = eventlet.spawn(func, "egg", spam="ham")
+        eventlet.sleep(0.1)
+
+        assert b"1" == redis_.get("lock:func(egg)")
+
+        # simulate locking attempt
+        redis_.incr("lock:func(egg)")
+
+        release.send()
+
+        assert tracker == thread.wait()
+
+        assert redis_.get("lock:func(egg)") is None
+
+        assert 2 == tracker.call_count
+
+
+class TestHook:
+    @pytest.fixture
+    def hook(self):
+        return Mock()
+
+    @pytest.fixture
+    def lock(self, redis_, hook):
+        return Lock(redis_, hook=hook)
+
+    def test_debounce(self, lock, hook, redis_):
+
+        tracker = Mock()
+
+        @lock.debounce(repeat=True, callback=tracker)
+        def func(*args, **kwargs):
+            if tracker.call_count == 0:
+                # simulate locking attempt
+                redis_.incr("lock:func(egg)")
+            return tracker
+
+        assert tracker == func("egg")
+
+        assert [
+            call("acquire_time", "func", ANY),
+            call("acquired", "func", None),
+            call("call_time", "func", ANY),
+            call("release_time", "func", ANY),
+            call("callback", "func", None),
+            # handed the key, the repeat does not acquire it
+            call("repeated", "func", None),
+            call("call_time", "func", ANY),
+            call("release_time", "func", ANY),
+        ] == hook.call_args_list
+
+        _, _, duration = hook.call_args_list[0][0]
+        assert 0 < duration < 1
+
+    def test_debounce_skipped(self, lock, hook, redis_):
+
+        @lock.debounce
+        def func(*args, **kwargs):
+            pass
+
+        redis_.incr("lock:func(egg)")
+
+        assert func("egg") is None
+
+        assert [
+            call("acquire_time", "func", ANY),
+            call("skipped", "func", None),
+        ] == hook.call_args_list
+
+    def test_skip_duplicates(self, lock, hook):
+
+        @lock.skip_duplicates
+        def func(*args, **kwargs):
+            pass
+
+        func("egg")
+        func("egg")
+
+        assert [
+            call("acquire_time", "func", ANY),
+            call("acquired", "func", None),
+            call("call_time", "func", ANY),
+            call("acquire_time", "func", ANY),
+            call("skipped", "func", None),
+        ] == hook.call_args_list
+
+    def test_failing_hook(self, redis_, caplog):
+
+        events = []
+
+        def hook(event, label, value=None):
+            events.append((event, label))
+            raise Exception("Whoops")
+
+        lock = Lock(redis_, hook=hook)
+
+        tracker = Mock()
+
+        @lock.debounce
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            return tracker
+
+        assert tracker == func("egg")
+        assert tracker == func("egg")
+
+        # the lock is released even though every hook call failed
+        assert 2 == tracker.call_count
+        assert b"0" == redis_.get("lock:func(egg)")
+
+        assert ("acquired", "func") in events
+        assert "Lock hook failed on acquired for func" in caplog.text
+
+
+class TestWindow:
+    @pytest.fixture
+    def lock(self, redis_):
+        return Lock(redis_)
+
+    @pytest.fixture
+    def tracker(self):
+        return Mock()
+
+    def test_trailing(self, lock, redis_, tracker):
+        @lock.debounce(wait=0.2)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        assert func("egg", spam="ham") is None
+        assert func("egg", spam="spam") is None
+        assert func("bacon") is None
+
+        assert 0 == lock.run_due()
+        assert 0 == tracker.call_count
+
+        # pending calls are stored as JSON, never pickled
+        name, args, kwargs = json.loads(redis_.get("lock:func(egg):window"))
+        assert name.endswith("TestWindow.test_trailing.<locals>.func")
+        assert (["egg"], {"spam": "spam"}) == (args, kwargs)
+        assert 0 < redis_.ttl("lock:func(egg):window") <= 31
+
+        eventlet.sleep(0.3)
+
+        assert 2 == lock.run_due()
+        assert 0 == lock.run_due()
+
+        # the latest call of each window is made once the window is over
+        assert [call("egg", spam="spam"), call("bacon")] == tracker.call_args_list
+
+        assert 0 == redis_.zcard("lock:windows")
+        assert redis_.get("lock:func(egg):window") is None
+
+    def test_trailing_deadline_extended(self, lock, tracker):
+        @lock.debounce(wait=0.2)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        func("egg", spam="ham")
+        eventlet.sleep(0.15)
+        func("egg", spam="spam")
+        eventlet.sleep(0.15)
+
+        # the burst has not settled yet
+        assert 0 == lock.run_due()
+
+        eventlet.sleep(0.1)
+
+        assert 1 == lock.run_due()
+        assert [call("egg", spam="spam")] == tracker.call_args_list
+
+    def test_leading(self, lock, tracker):
+        @lock.debounce(wait=0.2, leading=True)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            return tracker
+
+        assert tracker == func("egg", spam="ham")
+        assert func("egg", spam="spam") is None
+
+        assert [call("egg", spam="ham")] == tracker.call_args_list
+
+        eventlet.sleep(0.3)
+
+        assert 1 == lock.run_due()
+        assert [
+            call("egg", spam="ham"),
+            call("egg", spam="spam"),
+        ] == tracker.call_args_list
+
+    def test_leading_only_call_is_not_repeated(self, lock, tracker):
+        @lock.debounce(wait=0.2, leading=True)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        func("egg", spam="ham")
+
+        eventlet.sleep(0.3)
+
+        assert 0 == lock.run_due()
+        assert 1 == tracker.call_count
+
+        # the window is closed, the next call is leading again
+        func("egg", spam="spam")
+        assert 2 == tracker.call_count
+
+    def test_leading_without_trailing(self, lock, tracker):
+        @lock.debounce(wait=0.2, leading=True, trailing=False)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        func("egg", spam="ham")
+        func("egg", spam="spam")
+
+        eventlet.sleep(0.3)
+
+        assert 0 == lock.run_due()
+        assert [call("egg", spam="ham")] == tracker.call_args_list
+
+    def test_failing_call(self, lock, tracker, caplog):
+        class Whoops(Exception):
+            pass
+
+        tracker.side_effect = [Whoops("Yo!"), None, Whoops("Yo again!")]
+
+        @lock.debounce(wait=0.1)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        func("egg")
+        func("ham")
+        func("spam")
+
+        eventlet.sleep(0.2)
+
+        with pytest.raises(Whoops):
+            lock.run_due()
+
+        # other due calls are still made, and every failure logged
+        assert 3 == tracker.call_count
+        failures = [
+            record.exc_info[1]
+            for record in caplog.records
+            if record.getMessage().startswith("Failed making debounced call of")
+        ]
+        assert ["Yo!", "Yo again!"] == list(map(str, failures))
+
+    def test_unregistered_function_is_not_called(self, lock, redis_):
+
+        payload = json.dumps(["os:system", ["echo whoops"], {}])
+        redis_.set("lock:evil:window", payload)
+        redis_.zadd("lock:windows", {"lock:evil": 0})
+
+        with pytest.raises(LookupError):
+            lock.run_due()
+
+    @pytest.mark.parametrize(
+        "name", ("os:system", "os.path:join", "tests/../os:system", "os", "")
+    )
+    def test_unallowed_module_is_not_imported(self, lock, redis_, name):
+
+        payload = json.dumps([name, [], {}])
+        lock.backend.schedule("lock:windows", "lock:evil", 0, 30, payload)
+
+        with patch("importlib.import_module") as import_module:
+            with pytest.raises(LookupError):
+                lock.run_due(modules=("tests",))
+
+        assert not import_module.called
+
+    def test_function_registered_on_import(self, lock, tmp_path, monkeypatch):
+
+        tmp_path.joinpath("windowed_spam.py").write_text(
+            "from ddebounce import Lock, MemoryBackend\n"
+            "calls = []\n"
+            "@Lock(MemoryBackend()).debounce(wait=1)\n"
+            "def spam(*args):\n"
+            "    calls.append(args)\n"
+        )
+        monkeypatch.syspath_prepend(str(tmp_path))
+
+        # as pushed by another process which imported the function
+        payload = json.dumps(["windowed_spam:spam", ["egg"], {}])
+        lock.backend.schedule("lock:windows", "lock:spam(egg)", 0, 30, payload)
+
+        # not imported unless its module is allowed
+        with pytest.raises(LookupError):
+            lock.run_due()
+        lock.backend.schedule("lock:windows", "lock:spam(egg)", 0, 30, payload)
+        assert 1 == lock.run_due(modules=("windowed_spam",))
+
+        import windowed_spam
+
+        assert [("egg",)] == windowed_spam.calls
+
+    def test_method(self, lock, tracker):
+        class Spam:
+            @lock.debounce(wait=0.1)
+            def spam(self, *args, **kwargs):
+                tracker(*args, **kwargs)
+
+        with pytest.raises(TypeError):
+            Spam().spam("egg")
+
+    def test_worker(self, lock, tracker, caplog):
+        @lock.debounce(wait=0.1)
+        def func(*args, **kwargs):
+            if kwargs["spam"] == "egg":
+                raise Exception("Whoops")
+            tracker(*args, **kwargs)
+
+        func("bacon", spam="egg")
+        func("egg", spam="ham")
+        func("egg", spam="spam")
+
+        stop = threading.Event()
+        worker = threading.Thread(
+            target=lock.run_worker, kwargs=dict(interval=0.05, stop=stop)
+        )
+        worker.start()
+
+        time.sleep(0.3)
+
+        stop.set()
+        worker.join()
+
+        # failing calls are logged and do not stop the worker
+        assert "Failed making debounced calls" in caplog.text
+        assert [call("egg", spam="spam")] == tracker.call_args_list
+
+    def test_worker_drains_full_batches(self, lock, tracker):
+        @lock.debounce(wait=0.05)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        for index in range(5):
+            func(index)
+
+        time.sleep(0.1)
+
+        stop = threading.Event()
+
+        def run_due(limit, modules):
+            result = Lock.run_due(lock, limit, modules)
+            if result < limit:
+                stop.set()
+            return result
+
+        lock.run_due = run_due
+        # full batches are followed by another one without waiting
+        lock.run_worker(interval=10, limit=2, stop=stop)
+
+        assert 5 == tracker.call_count
+
+
+class TestLease:
+    @pytest.fixture
+    def lock(self, redis_):
+        return Lock(redis_, default_ttl=1, renew=True)
+
+    def test_debounce(self, lock, redis_):
+
+        @lock.debounce
+        def func(*args, **kwargs):
+            time.sleep(1.5)
+            # outlived default_ttl, still held
+            return redis_.get("lock:func(egg)")
+
+        assert b"1" == func("egg")
+        assert b"0" == redis_.get("lock:func(egg)")
+
+    def test_skip_duplicates(self, lock, redis_):
+
+        @lock.skip_duplicates
+        def func(*args, **kwargs):
+            time.sleep(1.5)
+            return redis_.get("lock:func(egg)")
+
+        assert b"1" == func("egg")
+        assert 0 < redis_.ttl("lock:func(egg)") <= 1
+
+    def test_not_renewed_by_default(self, redis_):
+
+        @Lock(redis_, default_ttl=1).skip_duplicates
+        def func(*args, **kwargs):
+            time.sleep(1.5)
+            return redis_.get("lock:func(egg)")
+
+        assert func("egg") is None
+
+    def test_failing_renewal(self, lock, caplog):
+
+        lock.backend = Mock(wraps=lock.backend)
+        lock.backend.extend.side_effect = Exception("Whoops")
+
+        @lock.skip_duplicates
+        def func(*args, **kwargs):
+            time.sleep(0.5)
+
+        func("egg")
+
+        assert lock.backend.extend.called
+        assert "Failed renewing lock:func(egg)" in caplog.text
+
+
+class TestKeys:
+    def test_namespace(self, redis_):
+
+        lock = Lock(redis_, namespace="spam")
+
+        @lock.debounce
+        def func(*args, **kwargs):
+            return redis_.get("spam:func(egg)")
+
+        assert b"1" == func("egg")
+
+    def test_hashed(self, redis_):
+
+        lock = Lock(redis_, digest_size=8)
+
+        payload = "egg" * 1000
+        key = lock.format_key("func({})".format(payload))
+
+        assert key.startswith("lock:func(eggeggeggeggeggeggeggeggegg:")
+        assert len("lock:") + 32 + 1 + 16 == len(key)
+        assert key == Lock(redis_, digest_size=8).format_key("func({})".format(payload))
+        assert key != lock.format_key("func({})".format(payload + "egg"))
+
+        @lock.debounce
+        def func(*args, **kwargs):
+            return redis_.get(key)
+
+        assert b"1" == func(payload)
+
+    def test_hash_tag(self, redis_):
+
+        lock = Lock(redis_, hash_tag=True)
+
+        assert "lock:{func(egg)}" == lock.format_key("func(egg)")
+        assert "lock:{func({'egg': 1})}" == lock.format_key("func({'egg': 1})")
+
+        key = Lock(redis_, hash_tag=True, digest_size=8).format_key("func(egg)")
+        assert key.startswith("lock:{func(egg):")
+        assert key.endswith("}")
+
+        @lock.debounce(latest=True, share=1, result_ttl=30)
+        def func(*args, **kwargs):
+            return redis_.get("lock:{func(egg)}").decode()
+
+        assert "1" == func("egg")
+
+        # everything kept along with the lock shares its slot
+        keys = redis_.keys("lock:*")
+        assert {
+            b"lock:{func(egg)}",
+            b"lock:{func(egg)}:result",
+            b"lock:{func(egg)}:memo",
+        } == set(keys)
+        assert 1 == len({key_slot(key) for key in keys})
+
+    def test_cluster_clients_hash_tagged(self, redis_):
+
+        assert not Lock(redis_).hash_tag
+        assert Lock(Mock(spec=RedisCluster)).hash_tag
+        assert not Lock(Mock(spec=RedisCluster), hash_tag=False).hash_tag
+
+    @pytest.mark.parametrize("digest_size", (0, 65))
+    def test_invalid_digest_size(self, redis_, digest_size):
+
+        with pytest.raises(ValueError):
+            Lock(redis_, digest_size=digest_size)
+
+    def test_api(self, redis_):
+
+        @skip_duplicates(redis_, namespace="spam", digest_size=4)
+        def func(*args, **kwargs):
+            pass
+
+        func("egg")
+
+        assert [b"spam:func(egg):"] == [key[:-8] for key in redis_.keys("spam:*")]
+
+
+class TestShare:
+    @pytest.fixture
+    def lock(self, redis_):
+        return Lock(redis_)
+
+    def in_flight(self, func, *args):
+        # runs func in a thread, returning once it started
+        outcome = []
+        thread = threading.Thread(target=lambda: outcome.append(func(*args)))
+        thread.start()
+        time.sleep(0.1)
+        return thread, outcome
+
+    def test_skip_duplicates(self, lock):
+
+        tracker = Mock()
+
+        @lock.skip_duplicates(share=1)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            time.sleep(0.2)
+            return ["ham", "spam"]
+
+        thread, outcome = self.in_flight(func, "egg")
+
+        assert ["ham", "spam"] == func("egg")
+
+        thread.join()
+        assert [["ham", "spam"]] == outcome
+        assert [call("egg")] == tracker.call_args_list
+
+        # shared for as long as the key is held
+        assert ["ham", "spam"] == func("egg")
+
+    def test_debounce(self, lock):
+
+        tracker = Mock()
+
+        @lock.debounce(share=1)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            time.sleep(0.2)
+            return "ham"
+
+        thread, _ = self.in_flight(func, "egg")
+
+        assert "ham" == func("egg")
+
+        thread.join()
+        assert [call("egg")] == tracker.call_args_list
+
+    def test_error(self, lock):
+
+        @lock.skip_duplicates(share=1)
+        def func(*args, **kwargs):
+            time.sleep(0.2)
+            raise ValueError("Whoops")
+
+        thread = threading.Thread(target=lambda: pytest.raises(ValueError, func, "egg"))
+        thread.start()
+        time.sleep(0.1)
+
+        with pytest.raises(SharedCallError) as exc_info:
+            func("egg")
+
+        thread.join()
+        assert ("ValueError", "Whoops") == exc_info.value.args
+
+    def test_timeout(self, lock):
+
+        @lock.debounce(share=0.1)
+        def func(*args, **kwargs):
+            time.sleep(0.4)
+            return "ham"
+
+        thread, outcome = self.in_flight(func, "egg")
+
+        assert func("egg") is None
+
+        thread.join()
+        assert ["ham"] == outcome
+
+    def test_unserializable_result(self, lock, caplog):
+
+        result = object()
+
+        @lock.skip_duplicates(share=0.3)
+        def func(*args, **kwargs):
+            time.sleep(0.1)
+            return result
+
+        thread, outcome = self.in_flight(func, "egg")
+
+        assert func("egg") is None
+
+        thread.join()
+        assert [result] == outcome
+        assert "Failed sharing outcome of lock:func(egg):result" in caplog.text
+
+    def test_previous_outcome_withdrawn(self, lock, redis_):
+
+        @lock.debounce(share=0.1)
+        def func(*args, **kwargs):
+            return redis_.get("lock:func(egg):result")
+
+        assert func("egg") is None
+        assert redis_.get("lock:func(egg):result") == b'{"result": null}'
+
+        # withdrawn once the next call starts
+        assert func("egg") is None
+
+    def test_outcome_kept_while_duplicates_hold_the_key(self, lock, redis_):
+
+        tracker = Mock()
+
+        @lock.skip_duplicates(share=1)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            return "ham"
+
+        assert "ham" == func("egg")
+
+        # about to expire before the key duplicates keep held
+        redis_.pexpire("lock:func(egg):result", 100)
+        assert "ham" == func("egg")
+        assert 30 == redis_.ttl("lock:func(egg):result")
+
+        time.sleep(0.2)
+        assert "ham" == func("egg")
+        assert 1 == tracker.call_count
+
+    def test_latest(self, lock, redis_):
+
+        @lock.debounce(latest=True, share=1)
+        def func(*args, **kwargs):
+            return redis_.get("lock:func(egg):result")
+
+        assert func("egg") is None
+        assert b'{"result": null}' == redis_.get("lock:func(egg):result")
+
+        # skipped, keeping its arguments and receiving the outcome kept
+        redis_.incr("lock:func(egg)")
+        assert func("egg", spam="ham") is None
+        assert b'[["egg"], {"spam": "ham"}]' == redis_.get("lock:func(egg):latest")
+
+    def test_time_window(self, lock):
+
+        with pytest.raises(ValueError):
+
+            @lock.debounce(wait=1, share=1)
+            def func(*args, **kwargs):
+                pass  # pragma: no cover
+
+
+class TestCoalesce:
+    @pytest.fixture
+    def lock(self, redis_):
+        lock = Lock(redis_, coalesce=True)
+        lock.backend = Mock(wraps=lock.backend)
+        return lock
+
+    def test_debounce(self, lock, redis_):
+
+        tracker = Mock()
+        started, finish = threading.Event(), threading.Event()
+
+        @lock.debounce(repeat=True)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            started.set()
+            finish.wait()
+            return redis_.get("lock:func(egg)")
+
+        thread = threading.Thread(target=func, args=("egg",))
+        thread.start()
+        started.wait()
+
+        # counted in process, the backend only sees the first call
+        assert func("egg") is None
+        assert func("egg") is None
+        assert 1 == lock.backend.acquire.call_count
+
+        finish.set()
+        thread.join()
+
+        # the coalesced calls made a single repeat
+        assert [call("egg"), call("egg")] == tracker.call_args_list
+        assert {} == lock.in_flight
+
+    def test_callback(self, lock):
+
+        callback = Mock()
+        started, finish = threading.Event(), threading.Event()
+
+        @lock.debounce(callback=callback)
+        def func(*args, **kwargs):
+            started.set()
+            finish.wait()
+
+        thread = threading.Thread(target=func, args=("egg",))
+        thread.start()
+        started.wait()
+
+        func("egg")
+        finish.set()
+        thread.join()
+
+        assert [call("egg")] == callback.call_args_list
+
+    def test_held_elsewhere(self, lock, redis_):
+
+        tracker = Mock()
+
+        @lock.debounce
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        redis_.incr("lock:func(egg)")
+
+        assert func("egg") is None
+        assert not tracker.called
+        assert b"2" == redis_.get("lock:func(egg)")
+        assert {} == lock.in_flight
+
+    def test_backend_failures(self, lock):
+
+        @lock.debounce
+        def func(*args, **kwargs):
+            pass
+
+        lock.backend.acquire.side_effect = ConnectionError("Whoops")
+        with pytest.raises(ConnectionError):
+            func("egg")
+        assert {} == lock.in_flight
+
+        lock.backend.acquire.side_effect = None
+        lock.backend.release.side_effect = ConnectionError("Whoops")
+        with pytest.raises(ConnectionError):
+            func("egg")
+        assert {} == lock.in_flight
+
+    def test_skip_duplicates_not_coalesced(self, lock):
+
+        @lock.skip_duplicates
+        def func(*args, **kwargs):
+            pass
+
+        func("egg")
+        func("egg")
+
+        assert 2 == lock.backend.acquire.call_count
+        assert {} == lock.in_flight
+
+
+class TestNearCache:
+    @pytest.fixture
+    def lock(self, redis_):
+        lock = Lock(redis_, near_cache=2)
+        lock.backend = Mock(wraps=lock.backend)
+        return lock
+
+    def test_skip_duplicates(self, lock, redis_):
+
+        tracker = Mock()
+
+        @lock.skip_duplicates
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        func("egg")
+        func("egg")
+        func("egg")
+
+        assert [call("egg")] == tracker.call_args_list
+        assert 1 == lock.backend.acquire.call_count
+        assert b"1" == redis_.get("lock:func(egg)")
+        assert {"hits": 2, "misses": 1} == lock.near_cache.stats
+
+    def test_held_elsewhere(self, lock, redis_):
+
+        tracker = Mock()
+
+        @lock.skip_duplicates
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)  # pragma: no cover
+
+        redis_.incr("lock:func(egg)")
+
+        func("egg")
+        func("egg")
+
+        assert not tracker.called
+        assert 1 == lock.backend.acquire.call_count
+
+    def test_expiry(self, redis_):
+
+        lock = Lock(redis_, default_ttl=1, near_cache=2)
+        lock.near_cache.clock = Mock(return_value=0)
+
+        @lock.skip_duplicates
+        def func(*args, **kwargs):
+            pass
+
+        func("egg")
+        assert "func(egg)" in lock.near_cache
+
+        lock.near_cache.clock.return_value = 1
+        assert "func(egg)" not in lock.near_cache
+        assert {} == lock.near_cache.expiries
+
+    def test_eviction(self, lock):
+
+        @lock.skip_duplicates
+        def func(*args, **kwargs):
+            pass
+
+        func("egg")
+        func("ham")
+        func("egg")
+        func("spam")
+
+        # least recently used first
+        assert ["func(egg)", "func(spam)"] == list(lock.near_cache.expiries)
+        assert 1 == lock.near_cache.stats["evictions"]
+
+    def test_debounce_not_cached(self, lock):
+
+        @lock.debounce
+        def func(*args, **kwargs):
+            pass
+
+        func("egg")
+        func("egg")
+
+        assert 2 == lock.backend.acquire.call_count
+        assert {} == lock.near_cache.expiries
+
+
+class TestMemoize:
+    @pytest.fixture
+    def lock(self, redis_):
+        return Lock(redis_, hook=Mock())
+
+    def test_debounce(self, lock, redis_):
+
+        tracker = Mock()
+
+        @lock.debounce(result_ttl=60)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            return {"spam": args[0]}
+
+        assert {"spam": "egg"} == func("egg")
+        assert {"spam": "egg"} == func("egg")
+        assert {"spam": "ham"} == func("ham")
+
+        assert [call("egg"), call("ham")] == tracker.call_args_list
+        assert b'{"result": {"spam": "egg"}}' == redis_.get("lock:func(egg):memo")
+        assert 0 < redis_.ttl("lock:func(egg):memo") <= 60
+        assert call("cached", "func", None) in lock.hook.call_args_list
+
+    def test_none_is_memoized(self, lock):
+
+        tracker = Mock()
+
+        @lock.debounce(result_ttl=60)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        assert func("egg") is None
+        assert func("egg") is None
+        assert 1 == tracker.call_count
+
+    def test_expiry(self, lock, redis_):
+
+        tracker = Mock()
+
+        @lock.debounce(result_ttl=60)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        func("egg")
+        redis_.delete("lock:func(egg):memo")
+        func("egg")
+
+        assert 2 == tracker.call_count
+
+    def test_serializer(self, redis_):
+
+        lock = Lock(redis_, serializer=pickle)
+
+        @lock.debounce(result_ttl=60)
+        def func(*args, **kwargs):
+            return {args[0]}
+
+        assert {"egg"} == func("egg")
+        assert {"egg"} == func("egg")
+        assert {"result": {"egg"}} == pickle.loads(redis_.get("lock:func(egg):memo"))
+
+    def test_unserializable_result(self, lock, caplog):
+
+        tracker = Mock()
+
+        @lock.debounce(result_ttl=60)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            return tracker
+
+        assert tracker == func("egg")
+        assert tracker == func("egg")
+
+        assert 2 == tracker.call_count
+        assert "Failed memoizing result of lock:func(egg):memo" in caplog.text
+
+    def test_time_window(self, lock):
+
+        with pytest.raises(ValueError):
+
+            @lock.debounce(wait=1, result_ttl=60)
+            def func(*args, **kwargs):
+                pass  # pragma: no cover
+
+
+class TestBlock:
+    @pytest.fixture
+    def lock(self, redis_):
+        return Lock(redis_)
+
+    def test_acquire_times_out(self, lock, redis_):
+
+        redis_.incr("lock:egg")
+
+        start = time.monotonic()
+        assert lock.acquire("egg", wait=0.2) is False
+        assert 0.2 <= time.monotonic() - start < 1
+
+        # counted as a single turn, retries add none
+        assert b"2" == redis_.get("lock:egg")
+
+    def test_acquire_woken_by_release(self, lock):
+
+        assert lock.acquire("egg") is True
+
+        timer = threading.Timer(0.1, lock.release, ("egg",))
+        timer.start()
+
+        start = time.monotonic()
+        assert lock.acquire("egg", wait=5) is True
+        assert time.monotonic() - start < 1
+        timer.join()
+
+    def test_shared_acquire_woken_by_release(self, lock, redis_):
+
+        assert lock.acquire("egg") is True
+        redis_.set("lock:egg:result", '{"result": "ham"}')
+
+        timer = threading.Timer(0.1, lock.release, ("egg",))
+        timer.start()
+
+        # taking the key withdraws the outcome of the previous call
+        assert lock.acquire("egg", wait=5, shared=True) is True
+        assert redis_.get("lock:egg:result") is None
+        assert b"1" == redis_.get("lock:egg")
+        timer.join()
+
+    def test_waiters_woken_in_turn(self, lock):
+
+        order = []
+
+        def waiter(name):
+            assert lock.acquire("egg", wait=5) is True
+            order.append(name)
+            time.sleep(0.05)
+            lock.release("egg")
+
+        assert lock.acquire("egg") is True
+        threads = [
+            threading.Thread(target=waiter, args=(name,))
+            for name in ("ham", "spam", "bacon")
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        lock.release("egg")
+        for thread in threads:
+            thread.join()
+
+        assert ["bacon", "ham", "spam"] == sorted(order)
+        assert time.monotonic() - start < 1
+        assert set() == lock.waited
+
+    def test_debounce(self, lock):
+
+        tracker = Mock()
+        started = threading.Event()
+
+        @lock.debounce(block=5)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            started.set()
+            time.sleep(0.1)
+            return tracker.call_count
+
+        thread = threading.Thread(target=func, args=("egg",))
+        thread.start()
+        started.wait()
+
+        # runs once the first call released the key
+        assert 2 == func("egg")
+        thread.join()
+
+    def test_debounce_with_repeat(self, lock):
+
+        tracker = Mock()
+        started = threading.Event()
+
+        @lock.debounce(block=5, repeat=True)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            started.set()
+            time.sleep(0.1)
+
+        thread = threading.Thread(target=func, args=("egg",))
+        thread.start()
+        started.wait()
+
+        # the waiter's turn is repeated once, its retries add no more
+        func("egg")
+        thread.join()
+
+        assert 3 == tracker.call_count
+        assert 0 == lock.status("func(egg)").count
+
+    def test_time_window(self, lock):
+
+        with pytest.raises(ValueError):
+
+            @lock.debounce(wait=1, block=1)
+            def func(*args, **kwargs):
+                pass  # pragma: no cover
+
+
+class TestLatest:
+    @pytest.fixture(params=(False, True), ids=("pipelined", "scripted"))
+    def lock(self, request, redis_):
+        return Lock(redis_, scripted=request.param)
+
+    def test_debounce(self, lock, redis_):
+
+        tracker, callback = Mock(), Mock()
+        started, finish = threading.Event(), threading.Event()
+
+        @lock.debounce(
+            key=lambda *args, **kwargs: "func",
+            repeat=True,
+            callback=callback,
+            latest=True,
+        )
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            if tracker.call_count == 1:
+                started.set()
+                finish.wait()
+
+        thread = threading.Thread(target=func, args=("egg",))
+        thread.start()
+        started.wait()
+
+        func("ham", spam=1)
+        func("spam", spam=2)
+
+        finish.set()
+        thread.join()
+
+        assert [call("egg"), call("spam", spam=2)] == tracker.call_args_list
+        assert [call("spam", spam=2)] == callback.call_args_list
+        assert redis_.get("lock:func:latest") is None
+
+    def test_own_arguments_not_repeated(self, lock, redis_):
+
+        tracker = Mock()
+
+        @lock.debounce(repeat=True, latest=True)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+
+        func("egg")
+
+        assert [call("egg")] == tracker.call_args_list
+        assert redis_.get("lock:func(egg):latest") is None
+
+    def test_expired_arguments(self, lock, redis_):
+
+        tracker = Mock()
+
+        @lock.debounce(repeat=True, latest=True)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            if tracker.call_count == 1:
+                # turn taken by a call whose arguments expired
+                redis_.incr("lock:func(egg)")
+                redis_.delete("lock:func(egg):latest")
+
+        func("egg")
+
+        assert [call("egg"), call("egg")] == tracker.call_args_list
+
+    def test_coalesced(self, redis_):
+
+        with pytest.raises(ValueError):
+
+            @Lock(redis_, coalesce=True).debounce(latest=True)
+            def func(*args, **kwargs):
+                pass  # pragma: no cover
+
+
+class TestBatch:
+    @pytest.fixture
+    def lock(self, redis_):
+        return Lock(redis_, hook=Mock())
+
+    def test_debounce_batch(self, lock, redis_):
+
+        tracker = Mock()
+        started, finish = threading.Event(), threading.Event()
+
+        @lock.debounce_batch(max_batch=2)
+        def func(items):
+            tracker(items)
+            started.set()
+            finish.wait()
+
+        thread = threading.Thread(target=func, args=("egg",))
+        thread.start()
+        started.wait()
+
+        assert func("ham") is None
+        assert func({"spam": 1}) is None
+        assert func("bacon") is None
+
+        finish.set()
+        thread.join()
+
+        assert [
+            call(["egg"]),
+            call(["ham", {"spam": 1}]),
+            call(["bacon"]),
+        ] == tracker.call_args_list
+        assert not redis_.exists("lock:func:batch")
+        assert b"0" == redis_.get("lock:func")
+
+    def test_custom_key(self, lock):
+
+        tracker = Mock()
+
+        @lock.debounce_batch(key=lambda item: item["index"])
+        def func(items):
+            tracker(items)
+
+        func({"index": "egg"})
+        func({"index": "ham"})
+
+        assert [
+            call([{"index": "egg"}]),
+            call([{"index": "ham"}]),
+        ] == tracker.call_args_list
+
+    def test_single_argument(self, lock):
+
+        @lock.debounce_batch
+        def func(items):
+            pass  # pragma: no cover
+
+        with pytest.raises(TypeError):
+            func("egg", "ham")
+        with pytest.raises(TypeError):
+            func("egg", spam="ham")
+
+    def test_call_after_last_drain(self, lock, redis_):
+
+        tracker = Mock()
+        release = lock.backend.release
+
+        def late_release(key, ttl):
+            if not tracker.call_count > 1:
+                lock.backend.acquire_batch(key, ttl, '"ham"')
+            return release(key, ttl)
+
+        lock.backend.release = late_release
+
+        @lock.debounce_batch
+        def func(items):
+            tracker(items)
+
+        func("egg")
+
+        assert [call(["egg"]), call(["ham"])] == tracker.call_args_list
+        assert call("repeated", "func", None) in lock.hook.call_args_list
+
+    def test_taken_over_after_release(self, lock, redis_):
+
+        tracker = Mock()
+        release = lock.backend.release
+
+        def late_release(key, ttl):
+            lock.backend.acquire_batch(key, ttl, '"ham"')
+            count = release(key, ttl)
+            # another caller acquires the key in between
+            redis_.incr(key)
+            return count
+
+        lock.backend.release = late_release
+
+        @lock.debounce_batch
+        def func(items):
+            tracker(items)
+
+        func("egg")
+
+        assert [call(["egg"])] == tracker.call_args_list
+        assert [b'"ham"'] == redis_.lrange("lock:func:batch", 0, -1)
+
+
+class TestExecutor:
+    @pytest.fixture
+    def pool(self):
+        pool = concurrent.futures.ThreadPoolExecutor(1)
+        yield pool
+        pool.shutdown()
+
+    def test_follow_up_off_the_caller(self, pool, redis_):
+
+        lock = Lock(redis_, executor=pool.submit)
+        tracker, callback = Mock(), Mock()
+        repeated = threading.Event()
+
+        @lock.debounce(repeat=True, callback=callback)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            if tracker.call_count == 1:
+                # simulate locking attempt
+                redis_.incr("lock:func(egg)")
+            else:
+                # the caller has returned by now
+                assert repeated.wait(5)
+            return tracker.call_count
+
+        assert 1 == func("egg")
+        repeated.set()
+        pool.shutdown(wait=True)
+
+        assert [call("egg"), call("egg")] == tracker.call_args_list
+        assert [call("egg")] == callback.call_args_list
+
+    def test_follow_up_acquires_the_key(self, redis_):
+
+        follow_ups = []
+        lock = Lock(redis_, executor=lambda *args: follow_ups.append(args))
+        tracker = Mock()
+
+        @lock.debounce(repeat=True)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            if tracker.call_count == 1:
+                redis_.incr("lock:func(egg)")
+
+        func("egg")
+
+        # the key is not held for a repeat the executor runs later on
+        assert 0 == lock.status("func(egg)").count
+
+        # taken by another caller by then
+        lock.acquire("func(egg)")
+        detached, *args = follow_ups.pop()
+        detached(*args)
+        assert 1 == tracker.call_count
+        assert 2 == lock.status("func(egg)").count
+
+        lock.release("func(egg)")
+        detached(*args)
+        assert 2 == tracker.call_count
+        assert 0 == lock.status("func(egg)").count
+
+    def test_uncontended_calls_not_dispatched(self, redis_):
+
+        executor = Mock()
+        lock = Lock(redis_, executor=executor)
+
+        @lock.debounce(repeat=True)
+        def func(*args, **kwargs):
+            return "ham"
+
+        assert "ham" == func("egg")
+        assert not executor.called
+
+    def test_failing_follow_up(self, pool, redis_, caplog):
+
+        lock = Lock(redis_, executor=pool.submit)
+        callback = Mock(side_effect=Exception("Whoops"))
+
+        @lock.debounce(callback=callback)
+        def func(*args, **kwargs):
+            redis_.incr("lock:func(egg)")
+            return "ham"
+
+        assert "ham" == func("egg")
+        pool.shutdown(wait=True)
+
+        assert callback.called
+        assert "Failed following up on debounced call" in caplog.text
+
+    def test_green_pool(self, redis_):
+
+        pool = eventlet.GreenPool(1)
+        lock = Lock(redis_, executor=pool.spawn)
+        tracker = Mock()
+
+        @lock.debounce(repeat=True)
+        def func(*args, **kwargs):
+            tracker(*args, **kwargs)
+            if tracker.call_count == 1:
+                redis_.incr("lock:func(egg)")
+
+        func("egg")
+        assert 1 == tracker.call_count
+
+        pool.waitall()
+        assert 2 == tracker.call_count
+
+
+class TestStatus:
+    def test_status(self, redis_):
+
+        lock = Lock(redis_, 30)
+
+        assert (0, None) == lock.status("spam")
+
+        lock.acquire("spam")
+        assert (1, 30) == lock.status("spam")
+
+        lock.acquire("spam")
+        count, ttl = lock.status("spam")
+        assert 2 == count
+        assert 0 < ttl <= 30
+
+        lock.release("spam")
+        assert 0 == lock.status("spam").count
+
+    def test_status_many(self, redis_):
+
+        lock = Lock(redis_, 30, digest_size=8)
+        lock.acquire("spam")
+        lock.acquire("ham")
+        lock.acquire("ham")
+        redis_.set(lock.format_key("egg"), "not a counter")
+        redis_.rpush(lock.format_key("list"), 1)
+
+        statuses = lock.status_many(["spam", "ham", "egg", "list", "nope"])
+
+        assert [1, 2, None, None, 0] == [status.count for status in statuses]
+        assert [30, 30, None, None, None] == [status.ttl for status in statuses]
@@ -0,0 +1,99 @@
+import runpy
+import sys
+
+from mock import patch
+import redis.cluster
+import pytest
+
+from ddebounce import Lock
+from ddebounce.__main__ import main
+
+
+@pytest.fixture
+def run(request, redis_, capsys):
+    uri = request.config.getoption("TEST_REDIS_URI")
+
+    def run(*argv):
+        main(["--redis-uri", uri, "--batch", "2"] + list(argv))
+        return capsys.readouterr().out.splitlines()
+
+    return run
+
+
+@pytest.fixture
+def lock(redis_):
+    lock = Lock(redis_, 30)
+    for key, turns in (("spam(1)", 3), ("spam(2)", 1), ("ham(1)", 2)):
+        for _ in range(turns):
+            lock.acquire(key)
+    redis_.set("lock:spam(1):memo", "{}", ex=20)
+    redis_.set("other:spam(1)", 1)
+    return lock
+
+
+def test_list(run, lock):
+
+    assert [
+        "lock:spam(1) 3 30",
+        "lock:spam(1):memo - 20",
+        "lock:spam(2) 1 30",
+    ] == sorted(run("list", "spam(*"))
+    assert 4 == len(run("list"))
+
+
+def test_count(run, lock):
+
+    assert ["4"] == run("count")
+    assert ["1"] == run("count", "ham(*")
+    assert ["0"] == run("count", "egg(*")
+
+
+def test_top(run, lock):
+
+    assert ["lock:spam(1) 3", "lock:ham(1) 2"] == run("top", "--limit", "2")
+
+
+def test_purge(run, lock, redis_):
+
+    assert ["3"] == run("purge", "spam(*")
+    assert ["1"] == run("count")
+    assert redis_.exists("other:spam(1)")
+
+    with pytest.raises(SystemExit):
+        run("purge")
+
+
+def test_run_as_module(request, lock, capsys):
+
+    uri = request.config.getoption("TEST_REDIS_URI")
+    argv = ["ddebounce", "--redis-uri", uri, "count"]
+    with patch("sys.argv", argv), patch.dict(sys.modules):
+        # run afresh, as python -m does
+        del sys.modules["ddebounce.__main__"]
+        runpy.run_module("ddebounce", run_name="__main__")
+
+    assert "4\n" == capsys.readouterr().out
+
+
+def test_hash_tag(run, redis_):
+
+    lock = Lock(redis_, 30, hash_tag=True)
+    lock.acquire("spam(1)")
+    lock.acquire("ham(1)")
+
+    assert ["lock:{spam(1)} 1 30"] == run("--hash-tag", "list", "spam(*")
+    assert ["0"] == run("count", "spam(*")
+
+
+def test_cluster(request, redis_, capsys):
+
+    uri = request.config.getoption("TEST_REDIS_URI")
+    Lock(redis_, hash_tag=True).acquire("spam(1)")
+
+    # stands in for a cluster client, hash tags being the default of those
+    with patch.object(redis.cluster.RedisCluster, "from_url") as from_url:
+        from_url.return_value = redis_
+        main(["--redis-uri", uri, "--cluster", "--hash-tag", "count"])
+
+    from_url.assert_called_once_with(uri)
+    assert "1\n" == capsys.readouterr().out
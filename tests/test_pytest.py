@@ -1,7 +1,7 @@
 from mock import Mock
 import pytest
 
-from ddebounce import debounce, skip_duplicates
+from ddebounce import debounce, debounce_batch, skip_duplicates, throttle
 
 
 @pytest.fixture
@@ -40,12 +40,26 @@ def test_debounce_applied_with_exact_attributes(debounce_applied, redis_):
     assert not debounce_applied(spam, ttl=60)
 
     assert debounce_applied(spam, key=key, repeat=True, callback=callback, ttl=60)
+    assert not debounce_applied(
+        spam, key=key, repeat=True, callback=callback, ttl=60, max_repeats=5
+    )
 
     assert not debounce_applied(
         spam, key=another_key, repeat=True, callback=callback, ttl=60
     )
 
 
+def test_debounce_applied_over_time_window(debounce_applied, redis_):
+    @debounce(redis_, wait=2.0, leading=True)
+    def spam():
+        pass
+
+    assert not debounce_applied(spam)
+    assert not debounce_applied(spam, wait=2.0)
+
+    assert debounce_applied(spam, wait=2.0, leading=True)
+
+
 def test_skip_duplicates_not_applied(skip_duplicates_applied):
     def spam():
         pass
@@ -72,3 +86,115 @@ def test_skip_duplicates_applied_with_exact_attributes(skip_duplicates_applied,
     assert not skip_duplicates_applied(spam, key=another_key)
 
     assert skip_duplicates_applied(spam, key=key, ttl=60)
+    assert not skip_duplicates_applied(spam, key=key, ttl=60, share=5)
+
+
+def test_shared_calls_applied(debounce_applied, skip_duplicates_applied, redis_):
+    @debounce(redis_, share=5)
+    def spam():
+        pass
+
+    @skip_duplicates(redis_, share=5)
+    def ham():
+        pass
+
+    assert not debounce_applied(spam)
+    assert debounce_applied(spam, share=5)
+    assert not debounce_applied(spam, share=5, result_ttl=60)
+    assert skip_duplicates_applied(ham, share=5)
+
+
+def test_throttle_not_applied(throttle_applied):
+    def spam():
+        pass
+
+    assert not throttle_applied(spam)
+
+
+def test_throttle_applied_with_exact_attributes(throttle_applied, redis_):
+    key = Mock()
+
+    @throttle(redis_, key=key, limit=5, per=60, delay=True)
+    def spam():
+        pass
+
+    assert not throttle_applied(spam)
+    assert not throttle_applied(spam, key=key, limit=5, per=60)
+
+    assert throttle_applied(spam, key=key, limit=5, per=60, delay=True)
+
+
+def test_memoized_calls_applied(debounce_applied, redis_):
+    @debounce(redis_, result_ttl=60)
+    def spam():
+        pass
+
+    assert not debounce_applied(spam)
+    assert debounce_applied(spam, result_ttl=60)
+
+
+def test_blocking_calls_applied(debounce_applied, redis_):
+    @debounce(redis_, block=5)
+    def spam():
+        pass
+
+    assert not debounce_applied(spam)
+    assert debounce_applied(spam, block=5)
+
+
+def test_latest_arguments_applied(debounce_applied, redis_):
+    @debounce(redis_, repeat=True, latest=True)
+    def spam():
+        pass
+
+    assert not debounce_applied(spam, repeat=True)
+    assert debounce_applied(spam, repeat=True, latest=True)
+
+
+def test_debounce_batch_applied(debounce_batch_applied, redis_):
+    @debounce_batch(redis_, max_batch=10)
+    def spam(items):
+        pass
+
+    def ham(items):
+        pass
+
+    assert not debounce_batch_applied(ham)
+    assert not debounce_batch_applied(spam)
+    assert debounce_batch_applied(spam, max_batch=10)
+
+
+def test_lock_backend(lock_backend, lock_clock):
+
+    tracker = Mock()
+
+    @debounce(lock_backend, ttl=30)
+    def spam(egg):
+        tracker()
+        return "ham"
+
+    assert "ham" == spam("egg")
+    assert 1 == tracker.call_count
+
+    # simulate a holder that never released
+    assert 1 == lock_backend.acquire("lock:spam(egg)", 30)
+    assert spam("egg") is None
+    assert 1 == tracker.call_count
+
+    lock_clock.advance(30)
+    assert "ham" == spam("egg")
+    assert 2 == tracker.call_count
+
+
+def test_lock_operations(lock_operations, lock_backend):
+    @skip_duplicates(lock_backend, ttl=30, share=1)
+    def spam(egg):
+        return "ham"
+
+    assert "ham" == spam("egg")
+    assert {"acquire_shared": 1, "publish": 1} == lock_operations
+
+    lock_backend.acquire("lock:spam(egg)", 30)
+    lock_operations.clear()
+    assert "ham" == spam("egg")
+    assert {"acquire_shared": 1, "receive": 1} == lock_operations
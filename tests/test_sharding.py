@@ -0,0 +1,226 @@
+from mock import Mock
+import pytest
+import redis
+
+from ddebounce import (
+    debounce,
+    Lock,
+    MemoryBackend,
+    RedisBackend,
+    ShardedBackend,
+    ShardedLock,
+    skip_duplicates,
+)
+
+
+@pytest.fixture
+def nodes():
+    return [MemoryBackend(), MemoryBackend()]
+
+
+@pytest.fixture
+def backend(nodes):
+    return ShardedBackend(nodes)
+
+
+@pytest.fixture
+def redis_nodes(redis_):
+    kwargs = dict(redis_.connection_pool.connection_kwargs)
+    kwargs["db"] += 1
+    other = redis.StrictRedis(connection_pool=redis.ConnectionPool(**kwargs))
+    yield [redis_, other]
+    other.flushdb()
+
+
+def keys(count):
+    return ["lock:spam({})".format(index) for index in range(count)]
+
+
+def test_routing(backend, nodes):
+
+    for key in keys(1000):
+        backend.acquire(key, 30)
+
+    held = [set(node.counters) for node in nodes]
+    assert not held[0] & held[1]
+    assert set(keys(1000)) == held[0] | held[1]
+    assert 400 < len(held[0]) < 600
+
+
+def test_adding_a_node_only_moves_keys_to_it(backend):
+
+    grown = ShardedBackend(backend.backends + [MemoryBackend()])
+
+    moved = [key for key in keys(1000) if backend.node(key) != grown.node(key)]
+
+    assert all(grown.node(key) == 2 for key in moved)
+    assert 200 < len(moved) < 450
+
+
+def test_hash_tags_share_a_node(backend):
+
+    nodes = {
+        backend.node("lock:{{spam({})}}{}".format(1, suffix))
+        for suffix in ("", ":wake", ":result", ":memo", ":latest")
+    }
+
+    assert 1 == len(nodes)
+    assert {backend.node("lock:{spam(1)}"), backend.node("lock:{spam(2)}")}
+
+
+def test_operations(backend, nodes):
+
+    assert 1 == backend.acquire("101", 30)
+    assert 1 == backend.acquire_latest("102", 30, "egg")
+    assert 1 == backend.acquire_batch("103", 30, "egg")
+    assert 1 == backend.acquire_shared("109", 30)
+    assert not backend.take("109", 30)
+    assert ["egg"] == backend.drain("103", 10)
+    assert backend.extend("101", 30)
+    assert 1 == backend.release("101", 30)
+    assert (1, "egg") == backend.release_latest("102", 30)
+    assert 0 == backend.handoff("101", 30)
+    assert (0, None) == backend.handoff_latest("102", 30)
+
+    backend.notify("104", 30)
+    assert backend.wait("104", 1)
+
+    backend.store("105", "egg", 30)
+    assert "egg" == backend.load("105")
+    backend.publish("106", "egg", 30)
+    assert "egg" == backend.receive("106", 1)
+
+    assert not backend.schedule("windows", "107", 0, 30, "egg")
+    assert [("107", "egg")] == backend.due("windows", 0, 10)
+
+    assert 0 == backend.hit("108", 0, 1, 1)
+    assert 1 == backend.hit("108", 0, 1, 1)
+
+
+def test_inspection(backend):
+
+    for key in keys(10):
+        backend.acquire(key, 30)
+    backend.acquire("lock:spam(3)", 30)
+
+    statuses = backend.status(keys(10) + ["lock:ham"])
+    assert [1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 0] == [count for count, _ in statuses]
+
+    assert set(keys(10)) == set(backend.scan("lock:spam(*", 1000))
+    assert 10 == backend.purge(keys(10) + ["lock:ham"])
+    assert [] == list(backend.scan("*", 1000))
+
+
+def test_inspecting_side_keys(redis_nodes):
+
+    backend = ShardedBackend(redis_nodes)
+    for key in keys(10):
+        backend.acquire_latest(key, 30, "egg")
+        backend.acquire_batch(key + "b", 30, "egg")
+        backend.schedule("lock:windows", key + "w", 1e10, 30, "egg")
+
+    side_keys = [
+        key + suffix
+        for key in keys(10)
+        for suffix in (":latest", "b:batch", "w:window")
+    ]
+    # kept on the node of the key they belong to, or of the window index
+    assert {backend.node(key) for key in keys(10)} == {0, 1}
+    assert all(count is None for count, _ in backend.status(side_keys))
+    assert all(0 < ttl <= 30 for _, ttl in backend.status(side_keys))
+    assert set(side_keys) < set(backend.scan("lock:spam(*", 1000))
+    assert 30 == backend.purge(side_keys)
+    assert [(0, None)] * 30 == backend.status(side_keys)
+
+
+def test_shards(redis_):
+
+    down = Mock()
+    down.ping.side_effect = redis.ConnectionError
+    lock = ShardedLock([redis_, down, MemoryBackend()], names=["a", "b", "c"])
+
+    shards = lock.shards()
+
+    assert ["a", "b", "c"] == [shard.name for shard in shards]
+    assert [True, False, True] == [shard.healthy for shard in shards]
+    assert 1 == pytest.approx(sum(shard.share for shard in shards))
+    assert all(0.2 < shard.share < 0.45 for shard in shards)
+
+
+def test_default_names(redis_nodes):
+
+    unix = redis.StrictRedis(unix_socket_path="/tmp/redis.sock", db=2)
+    backend = ShardedBackend(
+        [redis_nodes[0], RedisBackend(redis_nodes[1]), unix, MemoryBackend()]
+    )
+
+    assert [
+        "localhost:6379/11",
+        "localhost:6379/12",
+        "/tmp/redis.sock/2",
+        "3",
+    ] == backend.names
+
+    # the same nodes in another order route keys the same
+    ordered, reordered = ShardedBackend(redis_nodes), ShardedBackend(redis_nodes[::-1])
+    assert all(
+        ordered.names[ordered.node(key)] == reordered.names[reordered.node(key)]
+        for key in keys(100)
+    )
+
+
+def test_invalid_nodes():
+
+    with pytest.raises(ValueError):
+        ShardedBackend([])
+    with pytest.raises(ValueError):
+        ShardedBackend([MemoryBackend(), MemoryBackend()], names=["a", "a"])
+
+
+def test_sharded_lock(redis_, nodes):
+
+    lock = ShardedLock([redis_, nodes[0]], 30, scripted=True, namespace="spam")
+    tracker = Mock()
+
+    @lock.skip_duplicates
+    def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    for index in range(20):
+        func(index)
+
+    assert 20 == tracker.call_count
+    statuses = lock.status_many(["func({})".format(index) for index in range(20)])
+    assert [1] * 20 == [status.count for status in statuses]
+    # held across both nodes
+    assert 20 == redis_.dbsize() + len(nodes[0].counters)
+    assert 0 < redis_.dbsize() < 20
+
+
+def test_api_with_sharded_lock(redis_, nodes):
+
+    lock = ShardedLock([redis_, nodes[0]])
+    tracker = Mock()
+
+    @debounce(lock, repeat=True)
+    def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    for index in range(20):
+        func(index)
+
+    assert 20 == tracker.call_count
+    assert lock.backend is Lock(lock).backend
+
+
+def test_api(backend):
+
+    tracker = Mock()
+
+    @skip_duplicates(backend)
+    def func(*args, **kwargs):
+        tracker(*args, **kwargs)
+        return func(*args, **kwargs)
+
+    assert func("egg") is None
+    assert 1 == tracker.call_count
@@ -2,7 +2,7 @@ from mock import call, patch, Mock
 import operator
 import pytest
 
-from ddebounce import skip_duplicates
+from ddebounce import Lock, skip_duplicates
 
 
 @pytest.fixture
@@ -115,3 +115,22 @@ def test_custom_ttl(Lock):
     spam()
 
     assert Lock.call_args == call(redis_, 60)
+
+
+@patch("ddebounce.api.Lock", wraps=Lock)
+def test_lock_built_once_per_client(Lock, redis_):
+    class Spam:
+
+        redis = redis_
+
+        @skip_duplicates(operator.attrgetter("redis"))
+        def spam(self, *args, **kwargs):
+            pass
+
+    first, second = Spam(), Spam()
+
+    first.spam("egg")
+    first.spam("ham")
+    second.spam("egg")
+
+    assert 1 == Lock.call_count
@@ -0,0 +1,109 @@
+from mock import ANY, call, Mock
+import operator
+import pytest
+
+from ddebounce import Lock, throttle
+
+
+@pytest.fixture
+def tracker():
+    return Mock()
+
+
+class TestThrottle:
+    @pytest.fixture(params=("func", "meth", "meth_using_instance_client"))
+    def decorated(self, request, redis_, tracker):
+        @throttle(redis_, limit=2, per=10)
+        def spam(*args, **kwargs):
+            tracker(*args, **kwargs)
+            return tracker
+
+        class Spam:
+            @throttle(redis_, limit=2, per=10)
+            def spam(self, *args, **kwargs):
+                tracker(*args, **kwargs)
+                return tracker
+
+        class SpamWithClientOnInstance:
+
+            redis = redis_
+
+            @throttle(operator.attrgetter("redis"), limit=2, per=10)
+            def spam(self, *args, **kwargs):
+                tracker(*args, **kwargs)
+                return tracker
+
+        samples = {
+            "func": spam,
+            "meth": Spam().spam,
+            "meth_using_instance_client": SpamWithClientOnInstance().spam,
+        }
+
+        return samples[request.param]
+
+    def test_throttle(self, decorated, redis_, tracker):
+
+        assert tracker == decorated("egg", spam="ham")
+        assert tracker == decorated("egg", spam="ham")
+        assert decorated("egg", spam="ham") is None
+
+        assert 2 == redis_.zcard("lock:spam(egg):throttle")
+        assert 0 < redis_.pttl("lock:spam(egg):throttle") <= 10000
+
+        # counted per key
+        assert tracker == decorated("ham")
+
+        assert [
+            call("egg", spam="ham"),
+            call("egg", spam="ham"),
+            call("ham"),
+        ] == tracker.call_args_list
+
+
+def test_sliding_window(redis_, tracker):
+
+    lock = Lock(redis_)
+    key = "lock:spam:throttle"
+
+    assert 0 == lock.backend.hit(key, 100, 2, 10)
+    assert 0 == lock.backend.hit(key, 105, 2, 10)
+    assert 4 == lock.backend.hit(key, 106, 2, 10)
+
+    # the oldest call slides out of the window
+    assert 0 == lock.backend.hit(key, 110.5, 2, 10)
+    assert 4.5 == lock.backend.hit(key, 110.5, 2, 10)
+
+
+def test_delay(redis_, tracker):
+
+    lock = Lock(redis_)
+
+    @lock.throttle(limit=1, per=0.2, delay=True)
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    spam("egg")
+    spam("egg")
+
+    # the second call waited for the first one to leave the window
+    assert 2 == tracker.call_count
+    assert 1 == redis_.zcard("lock:spam(egg):throttle")
+
+
+def test_hook(redis_, tracker):
+
+    hook = Mock()
+
+    @throttle(redis_, key=lambda *args: "spam", hook=hook)
+    def spam(*args, **kwargs):
+        tracker(*args, **kwargs)
+
+    spam("egg")
+    spam("ham")
+
+    assert [call("egg")] == tracker.call_args_list
+    assert [
+        call("acquired", "spam", None),
+        call("call_time", "spam", ANY),
+        call("throttled", "spam", None),
+    ] == hook.call_args_list